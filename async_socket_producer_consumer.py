@@ -0,0 +1,418 @@
+import asyncio
+import json
+import random
+import time
+
+from buffer_storage import FilePayload
+from socket_producer_consumer import (
+    HOST, BUFFER_PORT, BLOCK_TIMEOUT, DEFAULT_CODEC, FRAME_PREFIX,
+    MAX_HEADER_SIZE, MAX_PAYLOAD_SIZE, BufferServer, CreditPacer, StudentSource
+)
+from student_codecs import get_codec
+from result_sinks import create_sink
+
+
+async def read_message(reader):
+    """Read one framed message as (header, payload), or None on EOF."""
+    try:
+        prefix = await reader.readexactly(FRAME_PREFIX.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("Connection closed mid-message")
+        return None
+    header_len, payload_len = FRAME_PREFIX.unpack(prefix)
+    if header_len > MAX_HEADER_SIZE or payload_len > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Frame too large ({header_len}+{payload_len} bytes)")
+    try:
+        header_bytes = await reader.readexactly(header_len)
+        payload = await reader.readexactly(payload_len)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed mid-message")
+    return json.loads(header_bytes.decode('utf-8')), payload
+
+
+def write_message(writer, header, payload=b''):
+    """Queue one framed message on the stream writer (caller drains)."""
+    header_bytes = json.dumps(header).encode('utf-8')
+    writer.write(FRAME_PREFIX.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+
+
+async def send_message(writer, header, payload=b''):
+    """Write one framed message and drain.
+
+    ``payload`` is as for socket_producer_consumer.send_message: the parts
+    of a list are written without joining them, and a FilePayload goes out
+    with ``loop.sendfile``.
+    """
+    parts = payload if isinstance(payload, list) else [payload]
+    header_bytes = json.dumps(header).encode('utf-8')
+    writer.write(FRAME_PREFIX.pack(len(header_bytes), sum(map(len, parts))) + header_bytes)
+    try:
+        for part in parts:
+            if isinstance(part, FilePayload):
+                await writer.drain()
+                with part.file:
+                    await asyncio.get_running_loop().sendfile(writer.transport, part.file)
+            elif len(part):
+                writer.write(part)
+        await writer.drain()
+    finally:
+        for part in parts:
+            if isinstance(part, FilePayload):
+                part.close()
+
+
+class AsyncBufferServer(BufferServer):
+    """Buffer server running every connection on a single asyncio event loop.
+
+    Request handling reuses BufferServer; only the networking and the waits
+    of blocking requests differ. Everything runs on the loop thread, so the
+    inherited lock is only contended by the lease reaper thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.stopped = None
+        self.writers = set()
+        self.async_not_full = None
+        self.async_not_empty = None
+
+    async def handle_request(self, request, payload, session):
+        """Execute one request, awaiting (not blocking) on full/empty waits."""
+        try:
+            self.check_request(request)
+        except ValueError as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        command = request.get('command')
+
+        if request.get('block') and command in ('PRODUCE', 'PRODUCE_MANY',
+                                                'CONSUME', 'CONSUME_MANY'):
+            try:
+                timeout = self.request_timeout(request)
+            except (TypeError, ValueError) as e:
+                return {'status': 'ERROR', 'message': str(e)}, b''
+            if command.startswith('PRODUCE'):
+                topics = self.produce_topics(request)
+                condition, ready = self.async_not_full, lambda: self.has_space_any(topics)
+            else:
+                topics = self.request_topics(request)
+                condition, ready = self.async_not_empty, lambda: self.has_item(topics)
+            parked = time.perf_counter() if self.metrics is not None and not ready() else None
+            # See BufferServer.filtered_waiters
+            filtered = command.startswith('CONSUME') and topics is not None
+            if filtered:
+                self.filtered_waiters += 1
+            try:
+                async with condition:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: ready() or not self.running),
+                        timeout
+                    )
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if filtered:
+                    self.filtered_waiters -= 1
+            if parked is not None:
+                self.metrics.block_wait.observe(time.perf_counter() - parked)
+            request = dict(request, block=False)
+
+        response, response_payload = self.handle_message(request, payload, session)
+
+        if response.get('status') == 'SUCCESS':
+            if command == 'PRODUCE':
+                await self._notify(self.async_not_empty, 1)
+            elif command == 'PRODUCE_MANY':
+                await self._notify(self.async_not_empty, response['accepted'])
+            elif command == 'CONSUME':
+                # A leased item keeps its slot until it is ACKed
+                if 'lease_id' not in response:
+                    await self._notify(self.async_not_full, 1)
+            elif command == 'CONSUME_MANY':
+                leased = request.get('lease') is not None
+                await self._notify(self.async_not_full, response['missing'] if leased
+                                   else len(response['items']) + response['missing'])
+            elif command == 'ACK':
+                await self._notify(self.async_not_full, response['acked'])
+            elif command == 'NACK':
+                await self._notify(self.async_not_empty, response['requeued'])
+        return response, response_payload
+
+    def _leases_expired(self, n):
+        # Called on the reaper thread: hand the wake-up to the loop
+        if self.loop is not None and self.running:
+            asyncio.run_coroutine_threadsafe(self._notify(self.async_not_empty, n), self.loop)
+
+    async def _notify(self, condition, n):
+        if n:
+            async with condition:
+                if self.wakes_all():
+                    condition.notify_all()
+                else:
+                    condition.notify(n)
+
+    async def handle_connection(self, reader, writer):
+        """Serve framed requests from one client until it disconnects."""
+        self.writers.add(writer)
+        session = {}
+        try:
+            while self.running:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                request, payload = message
+                started = time.perf_counter()
+                try:
+                    response, response_payload = await self.handle_request(request, payload,
+                                                                           session)
+                except Exception as e:
+                    # One bad request must not cost the client its connection
+                    print(f"[BUFFER] Error handling request: {e!r}")
+                    response, response_payload = {'status': 'ERROR', 'message': str(e)}, b''
+                self.observe_request(request, response, started)
+                await send_message(writer, response, response_payload)
+        except Exception as e:
+            if self.running:
+                print(f"[BUFFER] Error: {e}")
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def serve(self):
+        """Run the server until stop() is called."""
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.async_not_full = asyncio.Condition()
+        self.async_not_empty = asyncio.Condition()
+
+        server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port,
+            reuse_address=True, backlog=1024
+        )
+        print(f"[BUFFER] Async server started on {self.host}:{self.port}")
+        self._start_metrics_server()
+        self._start_lease_reaper()
+
+        async with server:
+            if self.running:
+                await self.stopped.wait()
+            for writer in list(self.writers):
+                writer.close()
+        self._stop_metrics_server()
+        self.buffer.close()
+        print("[BUFFER] Server stopped")
+
+    def start(self):
+        """Start the buffer server (blocks until stopped)."""
+        asyncio.run(self.serve())
+
+    async def _shutdown(self):
+        for condition in (self.async_not_full, self.async_not_empty):
+            async with condition:
+                condition.notify_all()
+        self.stopped.set()
+
+    def stop(self):
+        """Stop the server; safe to call from any thread."""
+        with self.lock:
+            self.running = False
+            self.lease_reaper.notify_all()
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+
+
+class AsyncBufferConnection:
+    """Persistent asyncio client connection to the buffer server."""
+
+    def __init__(self, host=HOST, port=BUFFER_PORT, codec=DEFAULT_CODEC):
+        self.host = host
+        self.port = port
+        self.codec = codec
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        """Open the stream, negotiating a non-default codec with HELLO."""
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.codec != DEFAULT_CODEC:
+            write_message(self.writer, {'command': 'HELLO', 'codecs': [self.codec]})
+            await self.writer.drain()
+            message = await read_message(self.reader)
+            if message is None or message[0].get('codec') != self.codec:
+                raise ConnectionError(f"Server does not support codec {self.codec}")
+
+    async def request(self, header, payload=b''):
+        """Send a request and return the (response, payload) pair."""
+        try:
+            if self.writer is None:
+                await self.connect()
+            write_message(self.writer, header, payload)
+            await self.writer.drain()
+            message = await read_message(self.reader)
+            if message is None:
+                raise ConnectionError("Server closed the connection")
+            return message
+        except Exception:
+            await self.close()
+            raise
+
+    async def close(self):
+        """Close the underlying stream."""
+        if self.writer is not None:
+            writer, self.reader, self.writer = self.writer, None, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+class AsyncProducer(StudentSource):
+    """asyncio producer client that generates and sends student data."""
+
+    def __init__(self, buffer_host=HOST, buffer_port=BUFFER_PORT, count=10,
+                 blocking=True, block_timeout=BLOCK_TIMEOUT, codec=DEFAULT_CODEC,
+                 first_number=1, produce_delay=(0.5, 1.5), topic_key=None,
+                 priority_key=None, seed=None):
+        self.count = count
+        self.first_number = first_number
+        self.blocking = blocking
+        self.block_timeout = block_timeout
+        self.produce_delay = produce_delay
+        super().__init__(topic_key, priority_key, seed, worker=first_number)
+        self.codec = get_codec(codec)
+        self.pacer = CreditPacer()
+        self.connection = AsyncBufferConnection(buffer_host, buffer_port, codec)
+
+    async def send_request(self, request, payload=b''):
+        """Send request to buffer server and return (response, payload)."""
+        try:
+            return await self.connection.request(request, payload)
+        except Exception as e:
+            print(f"[PRODUCER] Connection error: {e}")
+            return {'status': 'ERROR', 'message': str(e)}, b''
+
+    async def produce(self):
+        """Produce student data."""
+        print("[PRODUCER] Started")
+
+        students = self.students()
+        for i in range(self.first_number, self.first_number + self.count):
+            student = next(students)
+            data = self.codec.encode(student)
+
+            while True:
+                if self.pacer.starved and not self.blocking:
+                    await asyncio.sleep(self.pacer.backoff())
+                request = {
+                    'command': 'PRODUCE',
+                    'file_number': i,
+                    'block': self.blocking,
+                    'timeout': self.block_timeout,
+                    **self.routing(student)
+                }
+                response, _ = await self.send_request(request, data)
+                self.pacer.update(response)
+
+                if response['status'] == 'SUCCESS':
+                    print(f"[PRODUCER] Produced student{i}.xml")
+                    break
+                elif response['status'] == 'FULL':
+                    print(f"[PRODUCER] Buffer full, waiting...")
+                else:
+                    print(f"[PRODUCER] Error: {response.get('message')}")
+                    break
+
+            if self.produce_delay:
+                await asyncio.sleep(random.uniform(*self.produce_delay))
+
+        await self.connection.close()
+        print("[PRODUCER] Finished")
+
+
+class AsyncConsumer:
+    """asyncio consumer client that reads and processes student data."""
+
+    def __init__(self, buffer_host=HOST, buffer_port=BUFFER_PORT, count=10,
+                 blocking=True, block_timeout=BLOCK_TIMEOUT, codec=DEFAULT_CODEC,
+                 consume_delay=(1.0, 2.0), sink='console', sink_options=None,
+                 topics=None, lease=None):
+        self.count = count
+        self.blocking = blocking
+        self.block_timeout = block_timeout
+        self.consume_delay = consume_delay
+        self.topics = topics
+        self.lease = lease
+        self.codec = get_codec(codec)
+        self.consumed = 0
+        # Owned (created from a name) sinks are closed when consume() ends
+        self.owns_sink = isinstance(sink, str)
+        self.sink = create_sink(sink, **(sink_options or {})) if self.owns_sink else sink
+        self.connection = AsyncBufferConnection(buffer_host, buffer_port, codec)
+
+    async def send_request(self, request, payload=b''):
+        """Send request to buffer server and return (response, payload)."""
+        try:
+            return await self.connection.request(request, payload)
+        except Exception as e:
+            print(f"[CONSUMER] Connection error: {e}")
+            return {'status': 'ERROR', 'message': str(e)}, b''
+
+    async def consume(self):
+        """Consume student data."""
+        print("[CONSUMER] Started")
+
+        while self.consumed < self.count:
+            request = {
+                'command': 'CONSUME',
+                'block': self.blocking,
+                'timeout': self.block_timeout
+            }
+            if self.topics:
+                request['topics'] = list(self.topics)
+            if self.lease is not None:
+                request['lease'] = self.lease
+            response, data = await self.send_request(request)
+
+            if response['status'] == 'SUCCESS':
+                student = self.codec.decode(data)
+                print(f"[CONSUMER] Consumed student{response['file_number']}.xml")
+                self.sink.emit(student, response['file_number'])
+                if 'lease_id' in response:
+                    await self.send_request({'command': 'ACK', 'lease_id': response['lease_id']})
+                self.consumed += 1
+            elif response['status'] == 'EMPTY':
+                print(f"[CONSUMER] Buffer empty, waiting...")
+                if not self.blocking:
+                    await asyncio.sleep(1)
+                continue
+            else:
+                print(f"[CONSUMER] Error: {response.get('message')}")
+                await asyncio.sleep(1)
+
+            if self.consume_delay:
+                await asyncio.sleep(random.uniform(*self.consume_delay))
+
+        await self.connection.close()
+        if self.owns_sink:
+            # Joins the writer thread, so keep it off the event loop
+            await asyncio.to_thread(self.sink.close)
+        print(f"[CONSUMER] Finished (Processed {self.consumed} students)")
+
+
+async def run_async_clients(producers, consumers):
+    """Run asyncio producers and consumers concurrently on one loop."""
+    await asyncio.gather(
+        *(producer.produce() for producer in producers),
+        *(consumer.consume() for consumer in consumers)
+    )
+
+
+if __name__ == "__main__":
+    from socket_producer_consumer import run_socket_system
+
+    try:
+        run_socket_system(engine='asyncio')
+    except KeyboardInterrupt:
+        print("\n[SYSTEM] Interrupted by user")
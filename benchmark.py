@@ -0,0 +1,499 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from it_student import ITStudent
+from producer_consumer import ProducerConsumer
+from student_codecs import get_codec
+from student_generator import StudentGenerator
+from socket_producer_consumer import BufferServer, Producer, Consumer
+from async_socket_producer_consumer import (
+    AsyncBufferServer, AsyncProducer, AsyncConsumer, run_async_clients
+)
+
+
+def time_per_record(func, items, repeat=3):
+    """Best-of-`repeat` time per item, in microseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def benchmark_xml(count=2000, repeat=3):
+    """Compare the compact and pretty-printed XML paths of ITStudent."""
+    students = [ITStudent() for _ in range(count)]
+    pretty_docs = [student.to_xml(pretty=True).encode('utf-8') for student in students]
+    compact_docs = [student.to_xml().encode('utf-8') for student in students]
+
+    results = {
+        'to_xml_pretty_us': time_per_record(lambda s: s.to_xml(pretty=True), students, repeat),
+        'to_xml_compact_us': time_per_record(lambda s: s.to_xml(), students, repeat),
+        'from_xml_pretty_us': time_per_record(ITStudent.from_xml, pretty_docs, repeat),
+        'from_xml_compact_us': time_per_record(ITStudent.from_xml, compact_docs, repeat),
+        'pretty_bytes': sum(map(len, pretty_docs)) / count,
+        'compact_bytes': sum(map(len, compact_docs)) / count,
+    }
+
+    print("\n" + "="*60)
+    print(f"XML SERIALIZATION BENCHMARK ({count} records)")
+    print("="*60)
+    print(f"  {'':<22}{'pretty':>12}{'compact':>12}{'speedup':>10}")
+    for label, key in (('to_xml (us/record)', 'to_xml'), ('from_xml (us/record)', 'from_xml')):
+        pretty = results[f'{key}_pretty_us']
+        compact = results[f'{key}_compact_us']
+        print(f"  {label:<22}{pretty:>12.2f}{compact:>12.2f}{pretty / compact:>9.1f}x")
+    print(f"  {'size (bytes/record)':<22}{results['pretty_bytes']:>12.0f}{results['compact_bytes']:>12.0f}")
+    print("="*60 + "\n")
+    return results
+
+
+def benchmark_generator(count=100000, codec='xml'):
+    """Compare ITStudent() one at a time with StudentGenerator in bulk."""
+    encoder = get_codec(codec)
+    timings = {}
+
+    start = time.perf_counter()
+    students = [ITStudent() for _ in range(count)]
+    timings['itstudent'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for student in students:
+        encoder.encode(student)
+    timings['itstudent_encode'] = timings['itstudent'] + time.perf_counter() - start
+    del students
+
+    generator = StudentGenerator(seed=0)
+    start = time.perf_counter()
+    generator.generate(count)
+    timings['bulk'] = time.perf_counter() - start
+    start = time.perf_counter()
+    generator.serialize(count, encoder)
+    timings['bulk_encode'] = time.perf_counter() - start
+
+    results = {f'{key}_per_sec': count / seconds for key, seconds in timings.items()}
+    print("\n" + "="*60)
+    print(f"STUDENT GENERATION ({count} records, {codec}, "
+          f"{'numpy' if generator.use_numpy else 'pure Python'})")
+    print("="*60)
+    print(f"  {'':<22}{'ITStudent()':>14}{'bulk':>12}{'speedup':>10}")
+    for label, key in (('generate (rec/s)', ''), ('+ encode (rec/s)', '_encode')):
+        single = results[f'itstudent{key}_per_sec']
+        bulk = results[f'bulk{key}_per_sec']
+        print(f"  {label:<22}{single:>14.0f}{bulk:>12.0f}{bulk / single:>9.1f}x")
+    print("="*60 + "\n")
+    return results
+
+
+def run_pipeline(count, buffer_mode='semaphore', storage='file', num_producers=1,
+                 num_consumers=1, buffer_size=10):
+    """Run ProducerConsumer once with the sleeps disabled; return msgs/sec."""
+    shared_dir = tempfile.mkdtemp(prefix="pc_bench_")
+    try:
+        system = ProducerConsumer(
+            buffer_size=buffer_size, shared_dir=shared_dir, storage=storage,
+            num_producers=num_producers, num_consumers=num_consumers,
+            max_production=count, buffer_mode=buffer_mode,
+            produce_delay=None, consume_delay=None
+        )
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            system.run()
+            elapsed = time.perf_counter() - start
+            system.cleanup()
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+    return count / elapsed
+
+
+def benchmark_pipeline(count=2000, modes=('semaphore', 'handoff'), storages=('file', 'memory'),
+                       num_producers=2, num_consumers=2, buffer_size=10):
+    """Compare ProducerConsumer buffer modes and storage backends."""
+    results = []
+    print("\n" + "="*60)
+    print(f"PIPELINE THROUGHPUT ({count} students, {num_producers} producers, "
+          f"{num_consumers} consumers)")
+    print("="*60)
+    print(f"  {'mode':<12}{'storage':<10}{'msgs/sec':>12}")
+    for mode in modes:
+        for storage in storages:
+            try:
+                rate = run_pipeline(count, mode, storage, num_producers, num_consumers, buffer_size)
+            except ValueError as e:
+                print(f"  {mode:<12}{storage:<10}{'n/a':>12}  ({e})")
+                continue
+            results.append({'buffer_mode': mode, 'storage': storage, 'msgs_per_sec': rate})
+            print(f"  {mode:<12}{storage:<10}{rate:>12.0f}")
+    print("="*60 + "\n")
+    return results
+
+
+BENCHMARK_DEFAULTS = {
+    'pipeline': 'inprocess',     # 'inprocess' (ProducerConsumer) or 'socket'
+    'count': 2000,
+    'buffer_size': 10,
+    'producers': 1,
+    'consumers': 1,
+    'codec': 'xml',
+    'sink': 'console',           # where consumers send students (result_sinks)
+    'storage': 'memory',
+    'buffer_mode': 'semaphore',  # inprocess only
+    'processes': False,          # inprocess only: process-pool workers
+    'chunk_size': 64,            # inprocess only: records per process-pool task
+    'engine': 'thread',          # socket only: 'thread' or 'asyncio'
+    'batch_size': 1,             # socket only (thread engine)
+    'metrics': False,            # socket only: server-side instrumentation
+    'seed': None,                # socket only: reproducible bulk-generated students
+}
+
+
+class LatencyRecorder:
+    """Tracks when each student number was produced and how long it took to
+    reach a consumer."""
+
+    def __init__(self):
+        self.produced_at = {}
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def produced(self, number):
+        with self.lock:
+            self.produced_at.setdefault(number, time.perf_counter())
+
+    def consumed(self, number):
+        now = time.perf_counter()
+        with self.lock:
+            start = self.produced_at.pop(number, None)
+            if start is not None:
+                self.latencies.append(now - start)
+
+    def percentile(self, fraction):
+        """Nearest-rank percentile of the latencies, in milliseconds."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+        return ordered[index] * 1000
+
+
+class TimedProducerConsumer(ProducerConsumer):
+    """ProducerConsumer that reports each student's enqueue-to-parsed latency."""
+
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+        self.current = threading.local()
+
+    def _put(self, file_number, xml_data):
+        if file_number is not None:
+            self.recorder.produced(file_number)
+        return super()._put(file_number, xml_data)
+
+    def _get(self, blocking=True):
+        item = super()._get(blocking)
+        if item is not None and item[1] is not None:
+            # The numbers of the items the next _parse call decodes
+            if not hasattr(self.current, 'file_numbers'):
+                self.current.file_numbers = []
+            self.current.file_numbers.append(item[0])
+        return item
+
+    def _parse(self, payloads):
+        students = super()._parse(payloads)
+        for file_number in self.current.file_numbers:
+            self.recorder.consumed(file_number)
+        self.current.file_numbers.clear()
+        return students
+
+
+def _record_produced(recorder, request):
+    if request.get('command') == 'PRODUCE':
+        recorder.produced(request['file_number'])
+    elif request.get('command') == 'PRODUCE_MANY':
+        for item in request['items']:
+            recorder.produced(item['file_number'])
+
+
+def _record_consumed(recorder, response):
+    if response.get('status') == 'SUCCESS':
+        if 'file_number' in response:
+            recorder.consumed(response['file_number'])
+        for item in response.get('items', ()):
+            recorder.consumed(item['file_number'])
+
+
+class TimedProducer(Producer):
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send_request(self, request, payload=b''):
+        _record_produced(self.recorder, request)
+        return super().send_request(request, payload)
+
+
+class TimedConsumer(Consumer):
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send_request(self, request, payload=b''):
+        response, response_payload = super().send_request(request, payload)
+        _record_consumed(self.recorder, response)
+        return response, response_payload
+
+
+class TimedAsyncProducer(AsyncProducer):
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    async def send_request(self, request, payload=b''):
+        _record_produced(self.recorder, request)
+        return await super().send_request(request, payload)
+
+
+class TimedAsyncConsumer(AsyncConsumer):
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    async def send_request(self, request, payload=b''):
+        response, response_payload = await super().send_request(request, payload)
+        _record_consumed(self.recorder, response)
+        return response, response_payload
+
+
+def _split(count, parts):
+    """Split `count` into `parts` near-equal shares."""
+    return [count // parts + (1 if i < count % parts else 0) for i in range(parts)]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def _run_inprocess(config, recorder, shared_dir):
+    system = TimedProducerConsumer(
+        recorder, buffer_size=config['buffer_size'], shared_dir=shared_dir,
+        storage=config['storage'], num_producers=config['producers'],
+        num_consumers=config['consumers'], max_production=config['count'],
+        use_processes=config['processes'], chunk_size=config['chunk_size'],
+        buffer_mode=config['buffer_mode'],
+        produce_delay=None, consume_delay=None, codec=config['codec'],
+        sink=config['sink']
+    )
+    try:
+        start = time.perf_counter()
+        system.run()
+        elapsed = time.perf_counter() - start
+    finally:
+        system.cleanup()
+    return system.consumed_count, elapsed
+
+
+def _run_socket(config, recorder, shared_dir):
+    port = _free_port()
+    server_class = AsyncBufferServer if config['engine'] == 'asyncio' else BufferServer
+    server = server_class(port=port, max_size=config['buffer_size'], storage=config['storage'],
+                          shared_dir=shared_dir, codec=config['codec'],
+                          metrics=config['metrics'])
+    server_thread = threading.Thread(target=server.start)
+    server_thread.start()
+    try:
+        _wait_for_port(port)
+
+        produce_counts = _split(config['count'], config['producers'])
+        first_numbers = itertools.accumulate([1] + produce_counts[:-1])
+        producer_args = [dict(buffer_port=port, count=count, codec=config['codec'],
+                              first_number=first, produce_delay=None, seed=config['seed'])
+                         for count, first in zip(produce_counts, first_numbers)]
+        consumer_args = [dict(buffer_port=port, count=count, codec=config['codec'],
+                              consume_delay=None, sink=config['sink'])
+                         for count in _split(config['count'], config['consumers'])]
+
+        start = time.perf_counter()
+        if config['engine'] == 'asyncio':
+            producers = [TimedAsyncProducer(recorder, **kwargs) for kwargs in producer_args]
+            consumers = [TimedAsyncConsumer(recorder, **kwargs) for kwargs in consumer_args]
+            asyncio.run(run_async_clients(producers, consumers))
+        else:
+            producers = [TimedProducer(recorder, batch_size=config['batch_size'], **kwargs)
+                         for kwargs in producer_args]
+            consumers = [TimedConsumer(recorder, batch_size=config['batch_size'], **kwargs)
+                         for kwargs in consumer_args]
+            threads = ([threading.Thread(target=p.produce) for p in producers]
+                       + [threading.Thread(target=c.consume) for c in consumers])
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+        return sum(consumer.consumed for consumer in consumers), elapsed
+    finally:
+        server.stop()
+        server_thread.join()
+
+
+def run_benchmark(config):
+    """Run one pipeline configuration with the sleeps disabled.
+
+    Returns the configuration together with throughput, p50/p99 end-to-end
+    latency (from hand-off by the producer to receipt by a consumer), CPU
+    time and the process's peak RSS.
+    """
+    config = dict(BENCHMARK_DEFAULTS, **config)
+    runner = {'inprocess': _run_inprocess, 'socket': _run_socket}[config['pipeline']]
+    recorder = LatencyRecorder()
+    shared_dir = tempfile.mkdtemp(prefix="pc_bench_")
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            consumed, elapsed = runner(config, recorder, shared_dir)
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu_user = (usage_after.ru_utime - usage_before.ru_utime
+                + children_after.ru_utime - children_before.ru_utime)
+    cpu_system = (usage_after.ru_stime - usage_before.ru_stime
+                  + children_after.ru_stime - children_before.ru_stime)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_kb = usage_after.ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+
+    return dict(config, **{
+        'messages': consumed,
+        'elapsed_sec': round(elapsed, 4),
+        'msgs_per_sec': round(consumed / elapsed, 1),
+        'latency_p50_ms': recorder.percentile(0.50),
+        'latency_p99_ms': recorder.percentile(0.99),
+        'cpu_user_sec': round(cpu_user, 3),
+        'cpu_system_sec': round(cpu_system, 3),
+        'cpu_percent': round(100 * (cpu_user + cpu_system) / elapsed, 1),
+        'peak_rss_kb': peak_rss_kb,
+    })
+
+
+def run_isolated(config):
+    """Run one configuration in a fresh interpreter so its peak RSS and CPU
+    are not mixed up with earlier runs."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_benchmark, config).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Producer-consumer benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    xml_parser = subparsers.add_parser('xml', help="ITStudent XML serialization")
+    xml_parser.add_argument('--count', type=int, default=2000)
+    xml_parser.add_argument('--repeat', type=int, default=3)
+
+    generate_parser = subparsers.add_parser('generate', help="Bulk student generation")
+    generate_parser.add_argument('--count', type=int, default=100000)
+    generate_parser.add_argument('--codec', default='xml')
+
+    pipeline_parser = subparsers.add_parser('pipeline', help="In-process ProducerConsumer throughput")
+    pipeline_parser.add_argument('--count', type=int, default=2000)
+    pipeline_parser.add_argument('--modes', nargs='+', default=['semaphore', 'handoff'],
+                                 choices=['semaphore', 'handoff'])
+    pipeline_parser.add_argument('--storage', nargs='+', default=['file', 'memory'],
+                                 choices=['file', 'memory', 'log'])
+    pipeline_parser.add_argument('--producers', type=int, default=2)
+    pipeline_parser.add_argument('--consumers', type=int, default=2)
+    pipeline_parser.add_argument('--buffer-size', type=int, default=10)
+
+    run_parser = subparsers.add_parser(
+        'run', help="Pipeline benchmark suite with JSON results",
+        description="Runs every combination of the given pipelines and codecs "
+                    "and prints the results as a JSON list."
+    )
+    run_parser.add_argument('--pipeline', nargs='+', default=['inprocess', 'socket'],
+                            choices=['inprocess', 'socket'])
+    run_parser.add_argument('--codec', nargs='+', default=[BENCHMARK_DEFAULTS['codec']])
+    run_parser.add_argument('--sink', default=BENCHMARK_DEFAULTS['sink'],
+                            choices=['console', 'quiet', 'summary'])
+    run_parser.add_argument('--count', type=int, default=BENCHMARK_DEFAULTS['count'])
+    run_parser.add_argument('--buffer-size', type=int, default=BENCHMARK_DEFAULTS['buffer_size'])
+    run_parser.add_argument('--producers', type=int, default=BENCHMARK_DEFAULTS['producers'])
+    run_parser.add_argument('--consumers', type=int, default=BENCHMARK_DEFAULTS['consumers'])
+    run_parser.add_argument('--storage', default=BENCHMARK_DEFAULTS['storage'],
+                            choices=['file', 'memory', 'log'])
+    run_parser.add_argument('--buffer-mode', default=BENCHMARK_DEFAULTS['buffer_mode'],
+                            choices=['semaphore', 'handoff'])
+    run_parser.add_argument('--processes', action='store_true')
+    run_parser.add_argument('--chunk-size', type=int, default=BENCHMARK_DEFAULTS['chunk_size'],
+                            help="Records per process-pool task (with --processes)")
+    run_parser.add_argument('--engine', default=BENCHMARK_DEFAULTS['engine'],
+                            choices=['thread', 'asyncio'])
+    run_parser.add_argument('--batch-size', type=int, default=BENCHMARK_DEFAULTS['batch_size'])
+    run_parser.add_argument('--seed', type=int, default=BENCHMARK_DEFAULTS['seed'],
+                            help="Generate students in bulk from this seed (socket only)")
+    run_parser.add_argument('--metrics', action='store_true',
+                            help="Enable the buffer server's latency instrumentation")
+    run_parser.add_argument('--no-isolate', action='store_true',
+                            help="Run in this process instead of a fresh one per configuration")
+    run_parser.add_argument('--output', help="Write the JSON results to this file")
+
+    args = parser.parse_args(argv)
+    if args.benchmark == 'run':
+        runner = run_benchmark if args.no_isolate else run_isolated
+        results = []
+        for pipeline, codec in itertools.product(args.pipeline, args.codec):
+            results.append(runner({
+                'pipeline': pipeline, 'codec': codec, 'count': args.count,
+                'buffer_size': args.buffer_size, 'producers': args.producers,
+                'consumers': args.consumers, 'storage': args.storage,
+                'buffer_mode': args.buffer_mode, 'processes': args.processes,
+                'chunk_size': args.chunk_size,
+                'engine': args.engine, 'batch_size': args.batch_size,
+                'metrics': args.metrics, 'sink': args.sink, 'seed': args.seed,
+            }))
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + "\n")
+        print(output)
+    elif args.benchmark == 'xml':
+        benchmark_xml(args.count, args.repeat)
+    elif args.benchmark == 'generate':
+        benchmark_generator(args.count, args.codec)
+    elif args.benchmark == 'pipeline':
+        benchmark_pipeline(args.count, args.modes, args.storage, args.producers,
+                           args.consumers, args.buffer_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import bisect
+import hashlib
+import random
+import threading
+import time
+
+from it_student import ITStudent
+from socket_producer_consumer import (
+    HOST, BLOCK_TIMEOUT, DEFAULT_CODEC, BufferConnection, BufferServer, CreditPacer,
+    pack_items, unpack_items
+)
+from student_codecs import get_codec
+from result_sinks import create_sink
+
+CLUSTER_BASE_PORT = 5100
+VIRTUAL_NODES = 64
+
+
+class HashRing:
+    """Consistent-hash ring with ``vnodes`` virtual points per node.
+
+    Adding or removing a node only moves the keys between that node's points
+    and their predecessors, about 1/N of the keys.
+    """
+
+    def __init__(self, nodes=(), vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.points = []  # sorted hashes
+        self.owners = {}  # hash -> node
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest(),
+                              'big')
+
+    def __len__(self):
+        return len(set(self.owners.values()))
+
+    def __contains__(self, node):
+        return node in self.owners.values()
+
+    def nodes(self):
+        return sorted(set(self.owners.values()))
+
+    def add(self, node):
+        host, port = node
+        for i in range(self.vnodes):
+            point = self._hash(f"{host}:{port}#{i}")
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+                self.owners[point] = node
+
+    def remove(self, node):
+        self.points = [point for point in self.points if self.owners[point] != node]
+        self.owners = {point: self.owners[point] for point in self.points}
+
+    def node_for(self, key):
+        """The node owning ``key``: the first point clockwise from its hash."""
+        if not self.points:
+            raise LookupError("No nodes in the ring")
+        index = bisect.bisect(self.points, self._hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+class BufferCluster:
+    """Membership of a sharded buffer, shared by all of its clients.
+
+    New items are routed by consistent hashing over the ring. A node removed
+    with ``drain=True`` leaves the ring (so it gets no new items) but stays
+    in the consumers' rotation until one of them finds it empty with no
+    leased items in flight; a failed node is dropped immediately.
+    ``version`` changes on every membership change so clients can drop
+    connections to departed nodes.
+    """
+
+    def __init__(self, nodes=(), vnodes=VIRTUAL_NODES):
+        self.ring = HashRing(vnodes=vnodes)
+        self.draining = []
+        self.version = 0
+        self.lock = threading.Lock()
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        with self.lock:
+            if node in self.draining:
+                self.draining.remove(node)
+            self.ring.add(node)
+            self.version += 1
+        print(f"[CLUSTER] Added node {node[0]}:{node[1]}")
+
+    def remove_node(self, node, drain=True):
+        with self.lock:
+            self.ring.remove(node)
+            if drain and node not in self.draining:
+                self.draining.append(node)
+            elif not drain and node in self.draining:
+                self.draining.remove(node)
+            self.version += 1
+        print(f"[CLUSTER] Removed node {node[0]}:{node[1]}{' (draining)' if drain else ''}")
+
+    def node_failed(self, node):
+        """Drop an unreachable node without draining it."""
+        if node in self.consuming_nodes():
+            self.remove_node(node, drain=False)
+
+    def drained(self, node):
+        """A consumer found a removed node empty and without leases; forget it."""
+        with self.lock:
+            if node in self.draining:
+                self.draining.remove(node)
+                self.version += 1
+
+    def node_for(self, key):
+        with self.lock:
+            return self.ring.node_for(key)
+
+    def producing_nodes(self):
+        with self.lock:
+            return self.ring.nodes()
+
+    def consuming_nodes(self):
+        with self.lock:
+            return self.ring.nodes() + list(self.draining)
+
+
+class ShardedClient:
+    """One connection per cluster node, opened on first use."""
+
+    role = "CLIENT"
+
+    def __init__(self, cluster, persistent=True, codec=DEFAULT_CODEC):
+        self.cluster = cluster
+        self.persistent = persistent
+        self.codec_name = codec
+        self.codec = get_codec(codec)
+        self.connections = {}
+        self.version = None
+
+    def send_request(self, node, request, payload=b''):
+        """Send a request to one node and return (response, payload).
+
+        A node that cannot be reached is reported to the cluster as failed
+        and answered with a RETRY status so the caller re-routes.
+        """
+        if self.version != self.cluster.version:
+            self._prune()
+        connection = self.connections.get(node)
+        if connection is None:
+            connection = self.connections[node] = BufferConnection(
+                node[0], node[1], self.persistent, self.codec_name)
+        try:
+            return connection.request(request, payload)
+        except OSError as e:
+            print(f"[{self.role}] Node {node[0]}:{node[1]} unreachable: {e}")
+            self.connections.pop(node).close()
+            self.cluster.node_failed(node)
+            return {'status': 'RETRY', 'message': str(e)}, b''
+
+    def _prune(self):
+        """Close connections to nodes that have left the cluster."""
+        self.version = self.cluster.version
+        nodes = set(self.cluster.consuming_nodes())
+        for node in [node for node in self.connections if node not in nodes]:
+            self.connections.pop(node).close()
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+
+class ShardedProducer(ShardedClient):
+    """Producer routing each student to a node by consistent hash of its ID.
+
+    Students are sent in PRODUCE_MANY batches of up to ``batch_size``, one
+    per node; whatever a node could not take, or could not be delivered to a
+    failed node, is routed again, after an adaptive back-off when not
+    blocking. Each node's batch is cut to the credits it last granted.
+    """
+
+    role = "PRODUCER"
+
+    def __init__(self, cluster, count=10, persistent=True, blocking=True,
+                 block_timeout=BLOCK_TIMEOUT, batch_size=1, codec=DEFAULT_CODEC,
+                 first_number=1, produce_delay=(0.5, 1.5)):
+        super().__init__(cluster, persistent, codec)
+        self.count = count
+        self.first_number = first_number
+        self.blocking = blocking
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.produce_delay = produce_delay
+        self.pacers = {}  # node -> CreditPacer
+
+    def produce(self):
+        print(f"[PRODUCER] Started (sharded, batch size {self.batch_size})")
+        end = self.first_number + self.count
+        try:
+            for first in range(self.first_number, end, self.batch_size):
+                pending = []
+                for i in range(first, min(first + self.batch_size, end)):
+                    student = ITStudent()
+                    pending.append((student.student_id, i, self.codec.encode(student)))
+                self._send(pending)
+                if self.produce_delay:
+                    time.sleep(random.uniform(*self.produce_delay))
+        except LookupError as e:
+            print(f"[PRODUCER] Error: {e}")
+        finally:
+            self.close()
+        print("[PRODUCER] Finished")
+
+    def _send(self, pending):
+        """Deliver (student_id, file_number, data) entries to their nodes."""
+        while pending:
+            by_node = {}
+            for entry in pending:
+                by_node.setdefault(self.cluster.node_for(entry[0]), []).append(entry)
+            pending = []
+            for node, entries in by_node.items():
+                pacer = self.pacers.setdefault(node, CreditPacer())
+                n = pacer.allowance(len(entries))
+                pending += entries[n:]
+                entries = entries[:n]
+                items, payload = pack_items([(i, data) for _, i, data in entries])
+                request = {
+                    'command': 'PRODUCE_MANY',
+                    'items': items,
+                    'block': self.blocking,
+                    'timeout': self.block_timeout
+                }
+                response, _ = self.send_request(node, request, payload)
+                pacer.update(response)
+                if response['status'] in ('SUCCESS', 'FULL'):
+                    rejected = set(response['rejected'])
+                    for k, (_, i, _) in enumerate(entries):
+                        if k in rejected:
+                            pending.append(entries[k])
+                        else:
+                            print(f"[PRODUCER] Produced student{i}.xml on {node[0]}:{node[1]}")
+                elif response['status'] == 'RETRY':
+                    pending += entries
+                else:
+                    print(f"[PRODUCER] Error: {response.get('message')}")
+            if pending and not self.blocking:
+                starved = [pacer for pacer in self.pacers.values() if pacer.starved]
+                if starved:
+                    time.sleep(min(pacer.backoff() for pacer in starved))
+
+
+class ShardedConsumer(ShardedClient):
+    """Consumer draining every node of the cluster in turn.
+
+    Each request goes to the next node in the rotation without blocking;
+    after a full round of empty nodes the next request blocks for up to
+    ``idle_wait`` seconds so an idle consumer does not spin.
+    """
+
+    role = "CONSUMER"
+
+    def __init__(self, cluster, count=10, persistent=True, batch_size=1,
+                 codec=DEFAULT_CODEC, consume_delay=(1.0, 2.0), sink='console',
+                 sink_options=None, idle_wait=0.1, lease=None):
+        super().__init__(cluster, persistent, codec)
+        self.count = count
+        self.lease = lease
+        self.batch_size = batch_size
+        self.consume_delay = consume_delay
+        self.idle_wait = idle_wait
+        self.owns_sink = isinstance(sink, str)
+        self.sink = create_sink(sink, **(sink_options or {})) if self.owns_sink else sink
+        self.consumed = 0
+        self.turn = 0
+
+    def consume(self):
+        print("[CONSUMER] Started (sharded)")
+        idle = 0
+        while self.consumed < self.count:
+            nodes = self.cluster.consuming_nodes()
+            if not nodes:
+                print("[CONSUMER] Error: no nodes left in the cluster")
+                break
+            node = nodes[self.turn % len(nodes)]
+            self.turn += 1
+            request = {
+                'command': 'CONSUME_MANY',
+                'max_items': min(self.batch_size, self.count - self.consumed),
+                'block': idle >= len(nodes),
+                'timeout': self.idle_wait
+            }
+            if self.lease is not None:
+                request['lease'] = self.lease
+            response, payload = self.send_request(node, request)
+
+            entries = []
+            if response['status'] == 'SUCCESS':
+                entries = unpack_items(response['items'], payload)
+            elif response['status'] not in ('EMPTY', 'RETRY'):
+                print(f"[CONSUMER] Error: {response.get('message')}")
+            if not entries:
+                idle += 1
+                # A removed node is only done once no lease on it can expire
+                # and put an item back
+                if (response['status'] == 'EMPTY' and not response.get('inflight')
+                        and node not in self.cluster.producing_nodes()):
+                    self.cluster.drained(node)
+                continue
+
+            idle = 0
+            for file_num, data in entries:
+                student = self.codec.decode(data)
+                print(f"[CONSUMER] Consumed student{file_num}.xml from {node[0]}:{node[1]}")
+                self.sink.emit(student, file_num)
+                self.consumed += 1
+            # Leases are held by the node that handed the items out
+            lease_ids = [item['lease_id'] for item in response['items'] if 'lease_id' in item]
+            if lease_ids:
+                self.send_request(node, {'command': 'ACK', 'lease_ids': lease_ids})
+            if self.consume_delay:
+                time.sleep(random.uniform(*self.consume_delay))
+
+        self.close()
+        if self.owns_sink:
+            self.sink.close()
+        print(f"[CONSUMER] Finished (Processed {self.consumed} students)")
+
+
+def start_local_node(port, host=HOST, server_class=BufferServer, **options):
+    """Start one buffer server on a background thread; return (server, thread).
+
+    Each node gets its own ``shared_dir`` (``shared_files_shard_<port>``)
+    unless one is given.
+    """
+    options.setdefault('shared_dir', f"shared_files_shard_{port}")
+    server = server_class(host=host, port=port, **options)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def run_cluster_system(num_nodes=3, base_port=CLUSTER_BASE_PORT, storage='memory',
+                       count=10, codec=DEFAULT_CODEC):
+    """Run two producers and two consumers against a local sharded cluster.
+
+    Part way through a fourth node joins and the first one is removed (and
+    drained), to show the clients rebalancing.
+    """
+    print("\n" + "="*60)
+    print(f"SHARDED BUFFER CLUSTER ({num_nodes} nodes)")
+    print("="*60 + "\n")
+
+    nodes = {}
+    for port in range(base_port, base_port + num_nodes + 1):
+        nodes[(HOST, port)] = start_local_node(port, storage=storage)
+    time.sleep(1)  # Wait for the servers to start
+
+    node_list = list(nodes)
+    cluster = BufferCluster(node_list[:num_nodes])
+    producers = [ShardedProducer(cluster, count=count, codec=codec, first_number=1 + n * count)
+                 for n in range(2)]
+    consumers = [ShardedConsumer(cluster, count=count, codec=codec) for _ in range(2)]
+    threads = ([threading.Thread(target=p.produce) for p in producers]
+               + [threading.Thread(target=c.consume) for c in consumers])
+    for thread in threads:
+        thread.start()
+
+    time.sleep(count / 4)
+    cluster.add_node(node_list[num_nodes])
+    time.sleep(count / 4)
+    cluster.remove_node(node_list[0])
+
+    for thread in threads:
+        thread.join()
+    for server, thread in nodes.values():
+        server.stop()
+        thread.join()
+
+    print("\n" + "="*60)
+    print("CLUSTER SYSTEM COMPLETED")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    try:
+        run_cluster_system()
+    except KeyboardInterrupt:
+        print("\n[SYSTEM] Interrupted by user")
@@ -0,0 +1,198 @@
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency buckets: 1 microsecond doubling up
+# to about 16 seconds
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+COUNTERS = ('produced', 'consumed', 'redelivered', 'acked', 'full_rejections',
+            'empty_rejections', 'errors')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, exported cumulatively as Prometheus does."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is above every bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one duration in seconds."""
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        """Estimate a percentile as the upper bound of the bucket it falls in."""
+        with self.lock:
+            counts, count, largest = list(self.counts), self.count, self.max
+        if not count:
+            return None
+        rank = max(1, math.ceil(fraction * count))
+        seen = 0
+        for bound, n in zip(self.bounds + (largest,), counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, largest)
+        return largest
+
+    def snapshot(self):
+        """Summary of the histogram for the STATS command."""
+        with self.lock:
+            count, total, largest = self.count, self.total, self.max
+        return {
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else None,
+            'max': largest,
+            'p50': self.percentile(0.50),
+            'p90': self.percentile(0.90),
+            'p99': self.percentile(0.99)
+        }
+
+    def prometheus_lines(self, name, labels=''):
+        """Exposition lines for the histogram's buckets, sum and count."""
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.total
+        separator = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds, counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {total}')
+        lines.append(f'{name}_count{suffix} {count}')
+        return lines
+
+
+class BufferMetrics:
+    """Hot-path instrumentation of a buffer server.
+
+    Items are stamped with their enqueue time in a FIFO per buffer lane
+    (``key``) that runs parallel to the lane's storage, so the dequeue side
+    can record how long each item waited. ``enqueued`` and ``dequeued`` are
+    called with the buffer lock held.
+    """
+
+    HISTOGRAMS = {
+        'queue_wait': "Time items spent in the buffer",
+        'lock_wait': "Time spent waiting to acquire the buffer lock",
+        'lock_hold': "Time the buffer lock was held per acquisition",
+        'block_wait': "Time blocking requests waited for space or an item",
+    }
+
+    def __init__(self, pending=None):
+        # Items already in the buffer (e.g. recovered from a log) have no
+        # stamp; ``pending`` maps each lane key to how many there are
+        self.enqueued_at = {key: deque([None] * n) for key, n in (pending or {}).items()}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.queue_wait = Histogram()
+        self.lock_wait = Histogram()
+        self.lock_hold = Histogram()
+        self.block_wait = Histogram()
+        # Per-command time from receiving a request to having its response
+        self.service_time = {}
+        self.lock = threading.Lock()
+
+    def enqueued(self, key=None):
+        stamps = self.enqueued_at.get(key)
+        if stamps is None:
+            stamps = self.enqueued_at[key] = deque()
+        stamps.append(time.perf_counter())
+        self.counters['produced'] += 1
+
+    def dequeued(self, key=None, redelivery=False):
+        """Count a dequeued item; redeliveries were never stamped on the lane."""
+        if redelivery:
+            self.counters['redelivered'] += 1
+            return
+        stamps = self.enqueued_at.get(key)
+        stamp = stamps.popleft() if stamps else None
+        if stamp is not None:
+            self.queue_wait.observe(time.perf_counter() - stamp)
+        self.counters['consumed'] += 1
+
+    def observe_request(self, command, response, seconds):
+        """Record a handled request's service time and FULL/EMPTY/ERROR outcome."""
+        status = response.get('status')
+        with self.lock:
+            histogram = self.service_time.get(command)
+            if histogram is None:
+                histogram = self.service_time[command] = Histogram()
+            if status == 'FULL':
+                self.counters['full_rejections'] += 1
+            elif status == 'EMPTY':
+                self.counters['empty_rejections'] += 1
+            elif status == 'ERROR':
+                self.counters['errors'] += 1
+        histogram.observe(seconds)
+
+    def snapshot(self):
+        """Counters and histogram summaries (durations in seconds)."""
+        with self.lock:
+            service_time = dict(self.service_time)
+        histograms = {name: getattr(self, name).snapshot() for name in self.HISTOGRAMS}
+        histograms['service_time'] = {command: histogram.snapshot()
+                                      for command, histogram in service_time.items()}
+        return {'counters': dict(self.counters), 'histograms': histograms}
+
+    def render_prometheus(self, gauges=None):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, value in (gauges or {}).items():
+            lines += [f'# TYPE buffer_{name} gauge', f'buffer_{name} {value}']
+        for name, value in self.counters.items():
+            lines += [f'# TYPE buffer_{name}_total counter', f'buffer_{name}_total {value}']
+        for name, description in self.HISTOGRAMS.items():
+            metric = f'buffer_{name}_seconds'
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} histogram']
+            lines += getattr(self, name).prometheus_lines(metric)
+        with self.lock:
+            service_time = dict(self.service_time)
+        lines += ['# HELP buffer_service_time_seconds Time to handle a request',
+                  '# TYPE buffer_service_time_seconds histogram']
+        for command, histogram in service_time.items():
+            lines += histogram.prometheus_lines('buffer_service_time_seconds',
+                                                f'command="{command}"')
+        return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(render, host='localhost', port=9100):
+    """Serve ``render()`` as Prometheus text at http://host:port/metrics.
+
+    The HTTP server runs on a daemon thread; call ``shutdown()`` and
+    ``server_close()`` on the returned server to stop it.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,354 @@
+import mmap
+import os
+import struct
+import zlib
+from collections import Counter, deque
+from pathlib import Path
+
+# Log record header: file number, payload length, CRC32 of the payload
+RECORD_HEADER = struct.Struct('!qII')
+# Consumed offset: segment number and byte position of the next unread record
+OFFSET_RECORD = struct.Struct('!QQ')
+SEGMENT_SIZE = 4 * 1024 * 1024
+# Smaller files are read into memory even with sendfile: for them the extra
+# system calls cost more than the copy they save
+SENDFILE_MIN_SIZE = 64 * 1024
+
+
+class FilePayload:
+    """A dequeued payload still on disk, for sending with ``socket.sendfile``.
+
+    Holds the open file of an item whose name has already been unlinked, so
+    the data lives exactly as long as this object. ``read`` or ``send``
+    consumes it and closes the file.
+    """
+
+    __slots__ = ("file", "size")
+
+    def __init__(self, file):
+        self.file = file
+        self.size = os.fstat(file.fileno()).st_size
+
+    def __len__(self):
+        return self.size
+
+    def read(self):
+        with self.file:
+            return self.file.read()
+
+    def send(self, sock):
+        with self.file:
+            sock.sendfile(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+def payload_bytes(payload):
+    """The payload in memory: FilePayloads are read, anything else is returned as is."""
+    return payload.read() if isinstance(payload, FilePayload) else payload
+
+
+class FileStorage:
+    """FIFO of items whose XML payloads live as files in a shared directory.
+
+    Files are named ``student<N>.xml`` after the item's file number. If two
+    queued items share a number (several producers), the later one gets a
+    ``-<seq>`` suffix so neither file is overwritten. With ``sendfile=True``
+    (POSIX only) ``popleft`` returns a FilePayload for files of at least
+    SENDFILE_MIN_SIZE bytes instead of reading them into memory.
+    """
+
+    def __init__(self, shared_dir="shared_files_socket", sendfile=False):
+        self.shared_dir = shared_dir
+        self.sendfile = sendfile and os.name == 'posix'
+        Path(self.shared_dir).mkdir(parents=True, exist_ok=True)
+        self.queue = deque()
+        self.names = Counter()
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def keys(self):
+        """File numbers of the queued items, oldest first."""
+        return [file_num for file_num, _, _ in self.queue]
+
+    def _filename(self, file_num):
+        name = f"student{file_num}"
+        self.seq += 1
+        if self.names[name]:
+            return name, f"{name}-{self.seq}.xml"
+        return name, f"{name}.xml"
+
+    def append(self, file_num, payload):
+        """Write the payload to disk and queue the item."""
+        name, filename = self._filename(file_num)
+        with open(os.path.join(self.shared_dir, filename), 'wb') as f:
+            f.write(payload)
+        self.names[name] += 1
+        self.queue.append((file_num, name, filename))
+
+    def popleft(self):
+        """Dequeue the oldest item as (file_num, payload).
+
+        ``payload`` is None if the backing file has gone missing.
+        """
+        file_num, name, filename = self.queue.popleft()
+        self.names[name] -= 1
+        filepath = os.path.join(self.shared_dir, filename)
+        if not os.path.exists(filepath):
+            return file_num, None
+        f = open(filepath, 'rb')
+        if self.sendfile and os.fstat(f.fileno()).st_size >= SENDFILE_MIN_SIZE:
+            payload = FilePayload(f)
+        else:
+            with f:
+                payload = f.read()
+        os.remove(filepath)
+        return file_num, payload
+
+    def store(self, file_num, payload):
+        """Write a payload to ``student<N>.xml`` without queueing it.
+
+        For callers that keep their own queue of references (see
+        ProducerConsumer's handoff mode); returns the reference for load().
+        """
+        filepath = os.path.join(self.shared_dir, f"student{file_num}.xml")
+        with open(filepath, 'wb') as f:
+            f.write(payload)
+        return filepath
+
+    def load(self, ref):
+        """Read and delete a payload written by store(); None if it is gone."""
+        try:
+            with open(ref, 'rb') as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        os.remove(ref)
+        return payload
+
+    def close(self):
+        """Nothing to release; queued files stay on disk."""
+
+
+class MemoryStorage:
+    """Fixed-capacity ring buffer holding payloads directly in memory."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def keys(self):
+        """File numbers of the queued items, oldest first."""
+        return [self.slots[(self.head + i) % self.capacity][0] for i in range(self.count)]
+
+    def append(self, file_num, payload):
+        """Store the item in the next free slot."""
+        if self.count == self.capacity:
+            raise OverflowError("Ring buffer is full")
+        self.slots[(self.head + self.count) % self.capacity] = (file_num, payload)
+        self.count += 1
+
+    def popleft(self):
+        """Dequeue the oldest item as (file_num, payload)."""
+        if not self.count:
+            raise IndexError("pop from an empty ring buffer")
+        item = self.slots[self.head]
+        self.slots[self.head] = None
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        return item
+
+    def store(self, file_num, payload):
+        """The payload itself is the reference (see FileStorage.store)."""
+        return payload
+
+    def load(self, ref):
+        """Return a payload stored with store()."""
+        return ref
+
+    def close(self):
+        """Drop any payloads still held."""
+        self.slots = [None] * self.capacity
+        self.head = self.count = 0
+
+
+class LogStorage:
+    """FIFO backed by an append-only, segmented write-ahead log.
+
+    Records are appended to ``segment-<N>.log`` files in ``log_dir``, rolling
+    to a new segment once the active one reaches ``segment_size`` bytes. The
+    position of the next unconsumed record is kept in ``consumer.offset``;
+    segments that have been fully consumed are deleted. On start-up every
+    record past the consumed offset is recovered into the queue, and a torn
+    record at the end of a segment is truncated away.
+
+    ``fsync`` syncs each append and offset update to disk; ``use_mmap``
+    serves reads of sealed segments from a memory map instead of ``pread``.
+    """
+
+    def __init__(self, log_dir="shared_files_log", segment_size=SEGMENT_SIZE,
+                 fsync=False, use_mmap=False):
+        self.log_dir = log_dir
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.use_mmap = use_mmap
+        Path(self.log_dir).mkdir(parents=True, exist_ok=True)
+
+        # (segment, position, length, file_num) of every unconsumed record
+        self.queue = deque()
+        self.sealed = deque()
+        self.fds = {}
+        self.maps = {}
+        self.offset_fd = os.open(os.path.join(self.log_dir, "consumer.offset"),
+                                 os.O_RDWR | os.O_CREAT, 0o644)
+        self._recover()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def keys(self):
+        """File numbers of the queued items, oldest first."""
+        return [file_num for _, _, _, file_num in self.queue]
+
+    def _segment_path(self, segment):
+        return os.path.join(self.log_dir, f"segment-{segment:08d}.log")
+
+    def _recover(self):
+        """Rebuild the queue from the segments past the consumed offset."""
+        segments = sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(self.log_dir)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        data = os.pread(self.offset_fd, OFFSET_RECORD.size, 0)
+        if len(data) == OFFSET_RECORD.size:
+            consumed_segment, consumed_pos = OFFSET_RECORD.unpack(data)
+        else:
+            consumed_segment, consumed_pos = (segments[0] if segments else 0), 0
+
+        for segment in segments:
+            if segment < consumed_segment:
+                os.remove(self._segment_path(segment))
+                continue
+            start = consumed_pos if segment == consumed_segment else 0
+            self._scan_segment(segment, start)
+            self.sealed.append(segment)
+
+        self.active_segment = self.sealed.pop() if self.sealed else consumed_segment
+        self.writer = open(self._segment_path(self.active_segment), 'ab')
+        self.write_pos = self.writer.tell()
+
+    def _scan_segment(self, segment, start):
+        """Queue every intact record of a segment from ``start`` onwards."""
+        path = self._segment_path(segment)
+        position = start
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                file_num, length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                self.queue.append((segment, position + RECORD_HEADER.size, length, file_num))
+                position += RECORD_HEADER.size + length
+        if position < os.path.getsize(path):
+            print(f"[LOG] Truncating torn record in {path} at byte {position}")
+            os.truncate(path, position)
+
+    def _roll(self):
+        """Seal the active segment and start a new one."""
+        self.writer.close()
+        self.sealed.append(self.active_segment)
+        self.active_segment += 1
+        self.writer = open(self._segment_path(self.active_segment), 'ab')
+        self.write_pos = 0
+
+    def append(self, file_num, payload):
+        """Append a record to the log and queue it."""
+        if self.write_pos >= self.segment_size:
+            self._roll()
+        self.writer.write(RECORD_HEADER.pack(file_num, len(payload), zlib.crc32(payload)))
+        self.writer.write(payload)
+        self.writer.flush()
+        if self.fsync:
+            os.fsync(self.writer.fileno())
+        self.queue.append((self.active_segment, self.write_pos + RECORD_HEADER.size,
+                           len(payload), file_num))
+        self.write_pos += RECORD_HEADER.size + len(payload)
+
+    def _read(self, segment, position, length):
+        if self.use_mmap and segment != self.active_segment:
+            segment_map = self.maps.get(segment)
+            if segment_map is None:
+                with open(self._segment_path(segment), 'rb') as f:
+                    segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = segment_map
+            return segment_map[position:position + length]
+
+        fd = self.fds.get(segment)
+        if fd is None:
+            fd = self.fds[segment] = os.open(self._segment_path(segment), os.O_RDONLY)
+        return os.pread(fd, length, position)
+
+    def popleft(self):
+        """Dequeue the oldest record as (file_num, payload) and commit the offset."""
+        segment, position, length, file_num = self.queue.popleft()
+        payload = self._read(segment, position, length)
+        os.pwrite(self.offset_fd, OFFSET_RECORD.pack(segment, position + length), 0)
+        if self.fsync:
+            os.fsync(self.offset_fd)
+        self._compact()
+        return file_num, payload
+
+    def _compact(self):
+        """Delete sealed segments that hold no unconsumed records."""
+        next_segment = self.queue[0][0] if self.queue else self.active_segment
+        while self.sealed and self.sealed[0] < next_segment:
+            segment = self.sealed.popleft()
+            segment_map = self.maps.pop(segment, None)
+            if segment_map is not None:
+                segment_map.close()
+            fd = self.fds.pop(segment, None)
+            if fd is not None:
+                os.close(fd)
+            os.remove(self._segment_path(segment))
+
+    def close(self):
+        """Close all files; the log and offset stay on disk for recovery."""
+        self.writer.close()
+        for segment_map in self.maps.values():
+            segment_map.close()
+        for fd in self.fds.values():
+            os.close(fd)
+        self.maps.clear()
+        self.fds.clear()
+        os.close(self.offset_fd)
+
+
+STORAGE_BACKENDS = ('file', 'memory', 'log')
+
+
+def create_storage(kind, capacity, shared_dir, **options):
+    """Create a storage backend by name ('file', 'memory' or 'log').
+
+    Extra ``options`` are passed to FileStorage (sendfile) or LogStorage
+    (segment_size, fsync, use_mmap).
+    """
+    if kind == 'file':
+        return FileStorage(shared_dir, **options)
+    elif kind == 'memory':
+        return MemoryStorage(capacity)
+    elif kind == 'log':
+        return LogStorage(shared_dir, **options)
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,189 @@
+import os
+from collections import OrderedDict, deque
+from urllib.parse import quote, unquote
+
+from buffer_storage import create_storage
+
+DEFAULT_TOPIC = 'default'
+MAX_TOPIC_LENGTH = 200
+TOPICS_DIR = 'topics'
+
+
+def by_programme(student):
+    """Topic key putting each programme in its own topic."""
+    return student.programme
+
+
+def failing_first(student):
+    """Priority key serving failing students (0) before passing ones (1)."""
+    return 0 if student.determine_pass_fail() == "FAIL" else 1
+
+
+def topic_dir_name(topic):
+    """Percent-encode a topic name into a single path component.
+
+    ``quote`` leaves ``.`` and ``..`` alone, which would name the topics
+    directory or its parent, so their dots are encoded too; ``unquote``
+    gives the topic name back either way.
+    """
+    name = quote(topic, safe='')
+    if name in ('.', '..'):
+        name = name.replace('.', '%2E')
+    return name
+
+
+class TopicBuffer:
+    """Named, individually bounded topics, each split into priority lanes.
+
+    Every (topic, priority) lane is a FIFO storage backend of its own,
+    created on first use, so enqueue and dequeue stay O(1) whatever the
+    backend. Lower priority numbers are served first. A consumer takes from
+    the non-empty topics it subscribes to in round-robin order: a topic
+    that was just served moves to the back of the line. Items put back with
+    ``requeue`` (redeliveries) are served before the rest of their topic.
+
+    The default topic's priority-0 lane lives directly in ``shared_dir``, so
+    a single-topic server keeps its old on-disk layout; other lanes live in
+    ``shared_dir/topics/<topic>/priority-<n>`` and are recovered from there
+    on start-up; a lane beyond ``priorities`` raises ValueError rather than
+    being left unserved.
+    """
+
+    def __init__(self, storage='file', capacity=10, shared_dir="shared_files_socket",
+                 priorities=1, max_topics=64, **options):
+        if priorities < 1:
+            raise ValueError("priorities must be at least 1")
+        self.storage = storage
+        self.capacity = capacity
+        self.shared_dir = shared_dir
+        self.priorities = priorities
+        self.max_topics = max_topics
+        self.options = options
+        self.lanes = {}             # topic -> [storage or None per priority]
+        self.sizes = {}             # topic -> queued items
+        self.ready = OrderedDict()  # non-empty topics, next to serve first
+        self.retries = {}           # topic -> deque of requeued items
+        self.total = 0
+
+        # Every lane on disk is checked before any is opened
+        recovered = []
+        topics_dir = os.path.join(shared_dir, TOPICS_DIR)
+        if os.path.isdir(topics_dir):
+            for topic_dir in sorted(os.listdir(topics_dir)):
+                for lane_dir in os.listdir(os.path.join(topics_dir, topic_dir)):
+                    if lane_dir.startswith('priority-'):
+                        priority = int(lane_dir[len('priority-'):])
+                        if priority >= priorities:
+                            raise ValueError(
+                                f"Topic {unquote(topic_dir)!r} has a priority-{priority} lane "
+                                f"on disk but only {priorities} priorities are configured")
+                        recovered.append((unquote(topic_dir), priority))
+        self._lane(DEFAULT_TOPIC, 0)
+        for topic, priority in sorted(recovered):
+            self._lane(topic, priority)
+
+    def __len__(self):
+        return self.total
+
+    def size(self, topic=DEFAULT_TOPIC):
+        """Number of items queued in one topic."""
+        return self.sizes.get(topic, 0)
+
+    def topic_sizes(self):
+        return dict(self.sizes)
+
+    def lane_sizes(self):
+        """Queued items per (topic, priority) lane."""
+        return {(topic, priority): len(lane)
+                for topic, lanes in self.lanes.items()
+                for priority, lane in enumerate(lanes) if lane is not None}
+
+    def has_items(self, topics=None):
+        """True if any of ``topics`` (None: any topic) has an item queued."""
+        if topics is None:
+            return bool(self.ready)
+        return any(topic in self.ready for topic in topics)
+
+    def _lane_dir(self, topic, priority):
+        if topic == DEFAULT_TOPIC and priority == 0:
+            return self.shared_dir
+        return os.path.join(self.shared_dir, TOPICS_DIR, topic_dir_name(topic),
+                            f"priority-{priority}")
+
+    def _lane(self, topic, priority):
+        """Return the storage of a lane, creating the topic or lane if needed."""
+        lanes = self.lanes.get(topic)
+        if lanes is None:
+            if not isinstance(topic, str) or not topic or len(topic) > MAX_TOPIC_LENGTH:
+                raise ValueError(f"Invalid topic name: {topic!r}")
+            if len(self.lanes) >= self.max_topics:
+                raise ValueError(f"Too many topics (max {self.max_topics})")
+            lanes = self.lanes[topic] = [None] * self.priorities
+            self.sizes[topic] = 0
+        lane = lanes[priority]
+        if lane is None:
+            lane = lanes[priority] = create_storage(
+                self.storage, self.capacity, self._lane_dir(topic, priority), **self.options)
+            # A recovered log lane may already hold items
+            if len(lane):
+                self._added(topic, len(lane))
+        return lane
+
+    def _added(self, topic, n):
+        self.sizes[topic] += n
+        self.total += n
+        if topic not in self.ready:
+            self.ready[topic] = None
+
+    def priority(self, value):
+        """Clamp a requested priority to the configured lanes."""
+        return min(max(int(value or 0), 0), self.priorities - 1)
+
+    def append(self, file_num, payload, topic=DEFAULT_TOPIC, priority=0):
+        """Queue an item on a topic (the caller checks the topic's capacity)."""
+        self._lane(topic, self.priority(priority)).append(file_num, payload)
+        self._added(topic, 1)
+
+    def requeue(self, topic, priority, file_num, payload, deliveries):
+        """Put a previously dequeued item back at the front of its topic."""
+        self.retries.setdefault(topic, deque()).append((priority, file_num, payload, deliveries))
+        self._added(topic, 1)
+
+    def popleft(self, topics=None):
+        """Dequeue as (topic, priority, file_num, payload, deliveries).
+
+        Takes the first ready topic in ``topics`` (None: all topics): its
+        oldest requeued item if any, otherwise its highest-priority item.
+        That topic then moves to the back of the round-robin order.
+        ``deliveries`` is how often the item was handed out before (0 unless
+        it was requeued).
+        """
+        for topic in self.ready:
+            if topics is None or topic in topics:
+                break
+        else:
+            raise IndexError("pop from empty topics")
+
+        retries = self.retries.get(topic)
+        if retries:
+            priority, file_num, payload, deliveries = retries.popleft()
+        else:
+            deliveries = 0
+            for priority, lane in enumerate(self.lanes[topic]):
+                if lane is not None and len(lane):
+                    file_num, payload = lane.popleft()
+                    break
+        self.sizes[topic] -= 1
+        self.total -= 1
+        if self.sizes[topic]:
+            self.ready.move_to_end(topic)
+        else:
+            del self.ready[topic]
+        return topic, priority, file_num, payload, deliveries
+
+    def close(self):
+        self.retries.clear()
+        for lanes in self.lanes.values():
+            for lane in lanes:
+                if lane is not None:
+                    lane.close()
@@ -1,10 +1,15 @@
 import random
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
+from xml.sax.saxutils import escape
 
 class ITStudent:
     """Class representing an IT student with their academic information."""
     
+    # No per-instance __dict__; see student_batch.StudentBatch for holding
+    # large numbers of records
+    __slots__ = ("student_name", "student_id", "programme", "courses")
+    
     # Sample data for random generation
     FIRST_NAMES = ["Sipho", "Thandi", "Bongani", "Nomsa", "Mandla", "Zanele", 
                    "Sifiso", "Precious", "Lungelo", "Nokuthula"]
@@ -39,8 +44,25 @@ class ITStudent:
         selected_courses = random.sample(self.COURSES, num_courses)
         return {course: random.randint(30, 100) for course in selected_courses}
     
-    def to_xml(self):
-        """Convert student information to XML format."""
+    def to_xml(self, pretty=False):
+        """Convert student information to XML format.
+
+        The default is a compact document built directly as a string; pass
+        ``pretty=True`` for the indented minidom layout.
+        """
+        if not pretty:
+            parts = [
+                "<student><name>", escape(self.student_name),
+                "</name><student_id>", escape(self.student_id),
+                "</student_id><programme>", escape(self.programme),
+                "</programme><courses>"
+            ]
+            for course_name, mark in self.courses.items():
+                parts += ["<course><course_name>", escape(course_name),
+                          "</course_name><mark>", str(mark), "</mark></course>"]
+            parts.append("</courses></student>")
+            return "".join(parts)
+        
         root = ET.Element("student")
         
         name_elem = ET.SubElement(root, "name")
@@ -66,7 +88,10 @@ class ITStudent:
     
     @classmethod
     def from_xml(cls, xml_string):
-        """Create an ITStudent object from XML string."""
+        """Create an ITStudent object from an XML string or bytes.
+
+        Accepts both the compact and the pretty-printed layout.
+        """
         root = ET.fromstring(xml_string)
         
         student = cls.__new__(cls)
@@ -93,19 +118,26 @@ class ITStudent:
         """Determine if the student passed (average >= 50%)."""
         return "PASS" if self.calculate_average() >= 50 else "FAIL"
     
-    def display_info(self):
-        """Display student information in a formatted way."""
-        print("\n" + "="*60)
-        print(f"Student Name: {self.student_name}")
-        print(f"Student ID: {self.student_id}")
-        print(f"Programme: {self.programme}")
-        print("\nCourses and Marks:")
-        print("-" * 60)
+    def format_info(self):
+        """Return the display_info text (ending in a newline) as one string."""
+        lines = [
+            "\n" + "="*60,
+            f"Student Name: {self.student_name}",
+            f"Student ID: {self.student_id}",
+            f"Programme: {self.programme}",
+            "\nCourses and Marks:",
+            "-" * 60
+        ]
         for course, mark in self.courses.items():
-            print(f"  {course:<30} {mark:>3}")
-        print("-" * 60)
+            lines.append(f"  {course:<30} {mark:>3}")
+        lines.append("-" * 60)
         avg = self.calculate_average()
         status = self.determine_pass_fail()
-        print(f"Average Mark: {avg:.2f}")
-        print(f"Status: {status}")
-        print("="*60 + "\n")
\ No newline at end of file
+        lines.append(f"Average Mark: {avg:.2f}")
+        lines.append(f"Status: {status}")
+        lines.append("="*60 + "\n")
+        return "\n".join(lines) + "\n"
+    
+    def display_info(self):
+        """Display student information in a formatted way."""
+        print(self.format_info(), end="")
\ No newline at end of file
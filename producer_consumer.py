@@ -1,119 +1,290 @@
 import threading
 import time
-import os
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 from queue import Queue
 from pathlib import Path
 import random
 
 # Import the ITStudent class (assumes it's in the same directory)
 from it_student import ITStudent
+from buffer_storage import create_storage
+from student_codecs import get_codec
+from result_sinks import create_sink
+from student_stats import StudentStats
+
+def _init_worker():
+    """Give each worker process its own random state (forked workers would
+    otherwise all inherit the parent's and generate identical students)."""
+    random.seed()
+
+
+def generate_student(codec='xml'):
+    """Generate one random student encoded with `codec` (may run in a worker)."""
+    return get_codec(codec).encode(ITStudent())
+
+
+def parse_student(codec, data):
+    """Decode one student payload (may run in a worker process)."""
+    return get_codec(codec).decode(data)
+
+
+def generate_students(codec, n):
+    """Generate `n` encoded students in one worker task."""
+    codec = get_codec(codec)
+    return [codec.encode(ITStudent()) for _ in range(n)]
+
+
+def parse_students(codec, payloads):
+    """Decode several student payloads in one worker task."""
+    codec = get_codec(codec)
+    return [codec.decode(data) for data in payloads]
+
 
 class ProducerConsumer:
     """Implementation of the Producer-Consumer problem with semaphores."""
     
-    def __init__(self, buffer_size=10, shared_dir="shared_files"):
+    def __init__(self, buffer_size=10, shared_dir="shared_files", storage='file',
+                 storage_options=None, num_producers=1, num_consumers=1,
+                 max_production=10, use_processes=False, workers=None,
+                 buffer_mode='semaphore', produce_delay=(0.5, 1.5),
+                 consume_delay=(1.0, 2.0), codec='xml', sink='console',
+                 sink_options=None, aggregate=False, chunk_size=64):
         self.buffer_size = buffer_size
-        self.buffer = Queue(maxsize=buffer_size)
         self.shared_dir = shared_dir
+        self.num_producers = num_producers
+        self.num_consumers = num_consumers
+        
+        # In process mode student generation and XML parsing run in a pool
+        # of worker processes; only the buffer coordination stays here.
+        # Each task carries up to chunk_size records, so the inter-process
+        # round trip is paid once per chunk rather than once per student
+        self.use_processes = use_processes
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self.pool = None
+        
+        # Simulated work per item as a (min, max) range in seconds; None
+        # disables the sleep (e.g. for benchmarking)
+        self.produce_delay = produce_delay
+        self.consume_delay = consume_delay
+        
+        # Payload format (see student_codecs); XML by default
+        self.codec = get_codec(codec).name
+        
+        # Where consumed students go (see result_sinks): a sink name, written
+        # by a background thread, or a sink object owned by the caller
+        self.owns_sink = isinstance(sink, str)
+        self.sink = create_sink(sink, **(sink_options or {})) if self.owns_sink else sink
+        # Running per-programme/per-course statistics of consumed students;
+        # self.stats.snapshot() can be read while the simulation runs
+        self.stats = StudentStats() if aggregate else None
         
         # Create shared directory if it doesn't exist
         Path(self.shared_dir).mkdir(exist_ok=True)
         
+        # Where the XML payloads live: one file per student ('file'), an
+        # in-memory ring buffer ('memory') or a durable segmented log ('log')
+        self.storage = create_storage(storage, buffer_size, shared_dir,
+                                      **(storage_options or {}))
+        
+        # A log recovered on restart may already hold unconsumed students
+        recovered = self.storage.keys()
+        if recovered:
+            print(f"[RECOVERY] Recovered {len(recovered)} unconsumed students")
+        self.buffer = Queue(maxsize=max(buffer_size, len(recovered)))
+        for file_number in recovered:
+            self.buffer.put(file_number)
+        
+        # 'semaphore': classic mode, storage I/O happens inside the mutex.
+        # 'handoff': payloads are written/read outside any lock and only a
+        # (file number, reference) pair is handed over through a deque,
+        # whose append/popleft are atomic, so the mutex is not needed
+        if buffer_mode not in ('semaphore', 'handoff'):
+            raise ValueError(f"Unknown buffer mode: {buffer_mode}")
+        if buffer_mode == 'handoff' and not hasattr(self.storage, 'store'):
+            raise ValueError(f"Handoff mode does not support '{storage}' storage")
+        self.buffer_mode = buffer_mode
+        self.slots = deque()
+        
         # Semaphores for synchronization
         self.mutex = threading.Semaphore(1)  # Mutual exclusion
-        self.empty = threading.Semaphore(buffer_size)  # Count empty slots
-        self.full = threading.Semaphore(0)  # Count full slots
+        self.empty = threading.Semaphore(max(buffer_size - len(recovered), 0))  # Count empty slots
+        self.full = threading.Semaphore(len(recovered))  # Count full slots
+        
+        # Hands out student numbers to the producers
+        self.counter_lock = threading.Lock()
+        self.next_number = 1
         
         # Control flags
         self.is_producing = True
         self.production_count = 0
-        self.max_production = 10  # Produce 10 students
+        self.consumed_count = 0
+        self.max_production = max_production  # Number of students to produce
+    
+    def _claim_numbers(self, n=1):
+        """Return up to `n` consecutive student numbers to produce (empty when done).
+
+        A producer never takes more than its share of the numbers left, so
+        chunked claims still spread the work over every producer.
+        """
+        with self.counter_lock:
+            remaining = self.max_production - self.next_number + 1
+            n = min(n, -(-remaining // self.num_producers))
+            numbers = range(self.next_number, self.next_number + max(n, 0))
+            self.next_number += len(numbers)
+            return numbers
+    
+    def _generate(self, n=1):
+        """Generate `n` encoded students (in one worker task in process mode)."""
+        if self.pool is not None:
+            return self.pool.submit(generate_students, self.codec, n).result()
+        return [generate_student(self.codec) for _ in range(n)]
+    
+    def _parse(self, payloads):
+        """Decode several payloads (in one worker task in process mode)."""
+        if self.pool is not None:
+            return self.pool.submit(parse_students, self.codec, payloads).result()
+        return [parse_student(self.codec, data) for data in payloads]
+    
+    def _put(self, file_number, xml_data):
+        """Insert an item (None: a stop marker) and return the buffer size."""
+        if self.buffer_mode == 'handoff':
+            ref = None if file_number is None else self.storage.store(file_number, xml_data)
+            self.empty.acquire()
+            self.slots.append((file_number, ref))
+            size = len(self.slots)
+            self.full.release()
+            return size
+        
+        # Wait for empty slot
+        self.empty.acquire()
+        
+        # Critical section - mutual exclusion
+        self.mutex.acquire()
+        try:
+            if file_number is not None:
+                # Write XML file (or log record)
+                self.storage.append(file_number, xml_data)
+            
+            # Add file number to buffer
+            self.buffer.put(file_number)
+            size = self.buffer.qsize()
+        finally:
+            self.mutex.release()
+        
+        # Signal that buffer has item
+        self.full.release()
+        return size
+    
+    def _get(self, blocking=True):
+        """Remove the oldest item as (file_number, xml_content, buffer size).
+
+        Without ``blocking``, returns None if the buffer is empty.
+        """
+        if not self.full.acquire(blocking):
+            return None
+        if self.buffer_mode == 'handoff':
+            file_number, ref = self.slots.popleft()
+            size = len(self.slots)
+            self.empty.release()
+            xml_content = None if file_number is None else self.storage.load(ref)
+            return file_number, xml_content, size
+        
+        # Critical section - mutual exclusion
+        self.mutex.acquire()
+        try:
+            # Get file number from buffer
+            file_number = self.buffer.get()
+            xml_content = None
+            if file_number is not None:
+                # Read and delete the XML file (or consume the log record)
+                _, xml_content = self.storage.popleft()
+            size = self.buffer.qsize()
+        finally:
+            self.mutex.release()
+        
+        # Signal that buffer has empty slot
+        self.empty.release()
+        return file_number, xml_content, size
     
     def producer(self):
         """Producer thread: generates student data and stores as XML."""
-        print("[PRODUCER] Started")
+        name = threading.current_thread().name.upper()
+        print(f"[{name}] Started")
         
-        for i in range(1, self.max_production + 1):
-            # Generate student data
-            student = ITStudent()
-            xml_data = student.to_xml()
-            filename = f"student{i}.xml"
-            filepath = os.path.join(self.shared_dir, filename)
+        chunk_size = self.chunk_size if self.pool is not None else 1
+        while True:
+            numbers = self._claim_numbers(chunk_size)
+            if not numbers:
+                break
             
-            # Wait for empty slot
-            self.empty.acquire()
-            
-            # Critical section - mutual exclusion
-            self.mutex.acquire()
-            try:
-                # Write XML file
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(xml_data)
-                
-                # Add file number to buffer
-                self.buffer.put(i)
-                self.production_count += 1
-                
-                print(f"[PRODUCER] Produced: {filename} (Buffer size: {self.buffer.qsize()})")
+            # Generate student data
+            for i, xml_data in zip(numbers, self._generate(len(numbers))):
+                size = self._put(i, xml_data)
+                with self.counter_lock:
+                    self.production_count += 1
+                print(f"[{name}] Produced: student{i}.xml (Buffer size: {size})")
                 
-            finally:
-                self.mutex.release()
-            
-            # Signal that buffer has item
-            self.full.release()
-            
-            # Simulate production time
-            time.sleep(random.uniform(0.5, 1.5))
+                # Simulate production time
+                if self.produce_delay:
+                    time.sleep(random.uniform(*self.produce_delay))
         
+        print(f"[{name}] Finished production")
+    
+    def stop_consumers(self):
+        """Queue one stop marker per consumer behind the remaining items.
+
+        Each consumer exits when it takes a marker, so every consumer wakes
+        up exactly once after the last student and none is left blocked on
+        the ``full`` semaphore.
+        """
         self.is_producing = False
-        print("[PRODUCER] Finished production")
+        for _ in range(self.num_consumers):
+            self._put(None, None)
     
     def consumer(self):
         """Consumer thread: reads XML files and processes student data."""
-        print("[CONSUMER] Started")
+        name = threading.current_thread().name.upper()
+        print(f"[{name}] Started")
         consumed_count = 0
+        chunk_size = self.chunk_size if self.pool is not None else 1
         
-        while self.is_producing or not self.buffer.empty():
-            # Wait for full slot
-            self.full.acquire()
-            
-            # Critical section - mutual exclusion
-            self.mutex.acquire()
-            try:
-                # Get file number from buffer
-                file_number = self.buffer.get()
+        stopped = False
+        while not stopped:
+            # Wait for one item, then take whatever else is already queued
+            # (up to a chunk) so it can be parsed in a single worker task
+            items = []
+            item = self._get()
+            while item is not None:
+                file_number, xml_content, size = item
+                if file_number is None:
+                    stopped = True
+                    break
                 filename = f"student{file_number}.xml"
-                filepath = os.path.join(self.shared_dir, filename)
-                
-                print(f"[CONSUMER] Consuming: {filename} (Buffer size: {self.buffer.qsize()})")
-                
-                # Read XML file
-                if os.path.exists(filepath):
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        xml_content = f.read()
-                    
-                    # Parse student information
-                    student = ITStudent.from_xml(xml_content)
-                    
-                    # Display student information
-                    student.display_info()
-                    
-                    # Delete the file
-                    os.remove(filepath)
-                    consumed_count += 1
+                print(f"[{name}] Consuming: {filename} (Buffer size: {size})")
+                if xml_content is not None:
+                    items.append((file_number, xml_content))
                 else:
-                    print(f"[CONSUMER] ERROR: File {filename} not found!")
-                
-            finally:
-                self.mutex.release()
+                    print(f"[{name}] ERROR: File {filename} not found!")
+                item = self._get(blocking=False) if len(items) < chunk_size else None
             
-            # Signal that buffer has empty slot
-            self.empty.release()
-            
-            # Simulate consumption time
-            time.sleep(random.uniform(1.0, 2.0))
+            # Parse student information (in a worker process if enabled)
+            students = self._parse([xml_content for _, xml_content in items]) if items else []
+            for (file_number, _), student in zip(items, students):
+                # Hand the student to the result sink (does not wait on I/O)
+                self.sink.emit(student, file_number)
+                if self.stats is not None:
+                    self.stats.add(student)
+                consumed_count += 1
+                
+                # Simulate consumption time
+                if self.consume_delay:
+                    time.sleep(random.uniform(*self.consume_delay))
         
-        print(f"[CONSUMER] Finished consumption (Processed {consumed_count} students)")
+        with self.counter_lock:
+            self.consumed_count += consumed_count
+        print(f"[{name}] Finished consumption (Processed {consumed_count} students)")
     
     def run(self):
         """Start producer and consumer threads."""
@@ -121,26 +292,54 @@ class ProducerConsumer:
         print("PRODUCER-CONSUMER PROBLEM SIMULATION")
         print(f"Buffer Size: {self.buffer_size}")
         print(f"Students to Process: {self.max_production}")
+        print(f"Producers: {self.num_producers}  Consumers: {self.num_consumers}"
+              f"{'  (process pool)' if self.use_processes else ''}")
         print("="*60 + "\n")
         
-        # Create threads
-        producer_thread = threading.Thread(target=self.producer, name="Producer")
-        consumer_thread = threading.Thread(target=self.consumer, name="Consumer")
+        if self.use_processes:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=_init_worker)
         
-        # Start threads
-        producer_thread.start()
-        consumer_thread.start()
+        # Create threads
+        def thread_name(role, n, total):
+            return role if total == 1 else f"{role}-{n}"
+        producer_threads = [
+            threading.Thread(target=self.producer,
+                             name=thread_name("Producer", n, self.num_producers))
+            for n in range(1, self.num_producers + 1)
+        ]
+        consumer_threads = [
+            threading.Thread(target=self.consumer,
+                             name=thread_name("Consumer", n, self.num_consumers))
+            for n in range(1, self.num_consumers + 1)
+        ]
         
-        # Wait for threads to complete
-        producer_thread.join()
-        consumer_thread.join()
+        try:
+            # Start threads
+            for thread in producer_threads + consumer_threads:
+                thread.start()
+            
+            # Wait for the producers, then let every consumer drain and stop
+            for thread in producer_threads:
+                thread.join()
+            self.stop_consumers()
+            for thread in consumer_threads:
+                thread.join()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+            self.sink.flush()
         
         print("\n" + "="*60)
         print("SIMULATION COMPLETED")
         print("="*60 + "\n")
     
     def cleanup(self):
-        """Clean up shared directory."""
+        """Clean up shared directory (a durable log is kept for recovery)."""
+        if self.owns_sink:
+            self.sink.close()
+        self.storage.close()
         for file in Path(self.shared_dir).glob("student*.xml"):
             file.unlink()
         print(f"[CLEANUP] Removed all XML files from {self.shared_dir}")
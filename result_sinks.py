@@ -0,0 +1,269 @@
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+
+
+def student_record(student, file_number=None):
+    """Flatten a consumed student into a dict for the report sinks."""
+    return {
+        'file_number': file_number,
+        'student_id': student.student_id,
+        'name': student.student_name,
+        'programme': student.programme,
+        'courses': student.courses,
+        'average': round(student.calculate_average(), 2),
+        'status': student.determine_pass_fail()
+    }
+
+
+class ResultSink:
+    """Destination for consumed students.
+
+    Subclasses implement ``write_batch`` with a list of (file_number,
+    student) pairs; ``emit`` writes a single result synchronously.
+    """
+
+    def emit(self, student, file_number=None):
+        self.write_batch([(file_number, student)])
+
+    def write_batch(self, results):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class ConsoleSink(ResultSink):
+    """The original display_info output, written as one block per batch."""
+
+    def write_batch(self, results):
+        # sys.stdout is looked up on every write so redirection still applies
+        sys.stdout.write("".join(student.format_info() for _, student in results))
+
+    def flush(self):
+        sys.stdout.flush()
+
+
+class QuietSink(ResultSink):
+    """Discards the results, only counting them."""
+
+    def __init__(self):
+        self.count = 0
+
+    def write_batch(self, results):
+        self.count += len(results)
+
+
+class SummarySink(ResultSink):
+    """Keeps only aggregates and prints a summary table when closed."""
+
+    def __init__(self, print_on_close=True):
+        self.print_on_close = print_on_close
+        self.count = 0
+        self.passed = 0
+        self.programmes = {}  # programme -> [count, sum of averages]
+
+    def write_batch(self, results):
+        for _, student in results:
+            average = student.calculate_average()
+            self.count += 1
+            if average >= 50:
+                self.passed += 1
+            totals = self.programmes.setdefault(student.programme, [0, 0.0])
+            totals[0] += 1
+            totals[1] += average
+
+    def summary(self):
+        """Counts, pass/fail and average mark per programme."""
+        return {
+            'students': self.count,
+            'passed': self.passed,
+            'failed': self.count - self.passed,
+            'programmes': {
+                programme: {'students': count, 'average': total / count}
+                for programme, (count, total) in sorted(self.programmes.items())
+            }
+        }
+
+    def close(self):
+        if not self.print_on_close:
+            return
+        summary = self.summary()
+        lines = ["\n" + "=" * 60,
+                 f"Students: {summary['students']}  Passed: {summary['passed']}"
+                 f"  Failed: {summary['failed']}",
+                 "-" * 60]
+        for programme, totals in summary['programmes'].items():
+            lines.append(f"  {programme:<30} {totals['students']:>6} {totals['average']:>8.2f}")
+        lines.append("=" * 60 + "\n")
+        print("\n".join(lines))
+
+
+class ReportFileSink(ResultSink):
+    """Appends one line per student to a JSONL or CSV report file.
+
+    The file is rotated like logging's RotatingFileHandler: once it would
+    exceed ``max_bytes`` it is renamed to ``path.1`` (older reports shift to
+    ``path.2`` ... ``path.<backup_count>``) and a new file is started.
+    ``max_bytes=0`` never rotates.
+    """
+
+    CSV_FIELDS = ('file_number', 'student_id', 'name', 'programme', 'courses',
+                  'average', 'status')
+
+    def __init__(self, path, format='jsonl', max_bytes=10 * 1024 * 1024, backup_count=5):
+        if format not in ('jsonl', 'csv'):
+            raise ValueError(f"Unknown report format: {format}")
+        self.path = path
+        self.format = format
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = None
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, 'a', encoding='utf-8', newline='')
+        if self.format == 'csv' and self.file.tell() == 0:
+            self.file.write(",".join(self.CSV_FIELDS) + "\r\n")
+
+    def _rotate(self):
+        self.file.close()
+        if self.backup_count > 0:
+            for n in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{n}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{n + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _format(self, results):
+        records = [student_record(student, file_number) for file_number, student in results]
+        if self.format == 'jsonl':
+            return "".join(json.dumps(record, separators=(',', ':')) + "\n"
+                           for record in records)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for record in records:
+            record['courses'] = ";".join(f"{course}:{mark}"
+                                         for course, mark in record['courses'].items())
+            writer.writerow([record[field] for field in self.CSV_FIELDS])
+        return out.getvalue()
+
+    def write_batch(self, results):
+        text = self._format(results)
+        if (self.max_bytes and self.file.tell() > 0
+                and self.file.tell() + len(text) > self.max_bytes):
+            self._rotate()
+        self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BackgroundSink(ResultSink):
+    """Hands results to a writer thread that passes them on in batches.
+
+    ``emit`` only enqueues (it blocks only when ``max_pending`` results are
+    already waiting), so consumers never wait on the wrapped sink's I/O.
+    """
+
+    def __init__(self, sink, batch_size=256, max_pending=10000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="ResultSink", daemon=True)
+        self.thread.start()
+
+    def emit(self, student, file_number=None):
+        self.queue.put((file_number, student))
+
+    def write_batch(self, results):
+        for file_number, student in results:
+            self.queue.put((file_number, student))
+
+    def _run(self):
+        # Queue items are (file_number, student) results, an Event to set
+        # once everything before it is flushed, or None to stop
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            for item in batch + [False]:
+                if isinstance(item, tuple):
+                    results.append(item)
+                    continue
+                if results:
+                    self._write(results)
+                    results = []
+                if item is None:
+                    self.sink.flush()
+                    return
+                if item is not False:
+                    self.sink.flush()
+                    item.set()
+
+    def _write(self, results):
+        try:
+            self.sink.write_batch(results)
+        except Exception as e:
+            print(f"[SINK] Error writing {len(results)} results: {e}", file=sys.stderr)
+
+    def flush(self):
+        """Wait until everything emitted so far has been written."""
+        if self.closed:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Write the remaining results, stop the thread and close the sink."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+
+
+SINKS = ('console', 'quiet', 'summary', 'jsonl', 'csv')
+
+
+def create_sink(kind='console', background=True, **options):
+    """Build a result sink by name, by default behind a BackgroundSink.
+
+    'jsonl' and 'csv' take ReportFileSink's options (``path`` defaults to
+    ``results.jsonl`` / ``results.csv``); 'summary' takes ``print_on_close``.
+    """
+    if kind == 'console':
+        sink = ConsoleSink()
+    elif kind == 'quiet':
+        sink = QuietSink()
+    elif kind == 'summary':
+        sink = SummarySink(**options)
+    elif kind in ('jsonl', 'csv'):
+        options.setdefault('path', f"results.{kind}")
+        sink = ReportFileSink(format=kind, **options)
+    else:
+        raise ValueError(f"Unknown sink: {kind}")
+    return BackgroundSink(sink) if background else sink
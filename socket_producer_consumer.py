@@ -1,12 +1,22 @@
+import asyncio
+import heapq
+import itertools
 import socket
+import struct
 import threading
 import time
 import json
-import os
-from pathlib import Path
 import random
+from collections import Counter
 
 from it_student import ITStudent
+from buffer_topics import DEFAULT_TOPIC, TopicBuffer
+from buffer_metrics import BufferMetrics, start_metrics_server
+from result_sinks import create_sink
+from student_stats import StudentStats
+from buffer_storage import FilePayload, payload_bytes
+from student_codecs import get_codec, negotiate_codec
+from student_generator import StudentGenerator
 
 # Configuration
 HOST = 'localhost'
@@ -14,96 +24,901 @@ BUFFER_PORT = 5000
 PRODUCER_PORT = 5001
 CONSUMER_PORT = 5002
 BUFFER_SIZE = 10
+GENERATOR_CHUNK = 1024  # Students a seeded single-item producer draws at a time
+BLOCK_TIMEOUT = 5.0  # Seconds a blocking PRODUCE/CONSUME waits server-side
+DEFAULT_CODEC = 'xml'  # Payload format of connections that never send HELLO
+
+# Every message is framed as an 8-byte prefix (header length, payload length)
+# followed by a UTF-8 JSON header and the raw payload bytes (the student XML).
+FRAME_PREFIX = struct.Struct('!II')
+MAX_HEADER_SIZE = 64 * 1024
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+MAX_SEND_BUFFERS = 512  # Buffers per sendmsg call, below every platform's IOV_MAX
+# Zero-copy only pays off for large messages: below this many bytes a
+# message is joined before sending and a received payload copied to bytes
+ZERO_COPY_MIN_SIZE = 64 * 1024
+
+
+def recv_into_exact(sock, buffer):
+    """Fill the writable ``buffer`` from the socket.
+
+    Returns False on a clean EOF before the first byte.
+    """
+    size = len(buffer)
+    received = sock.recv_into(buffer) if size else 0
+    if received == size:
+        return True
+    if not received:
+        return False
+    view = memoryview(buffer)
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError("Connection closed mid-message")
+        received += n
+    return True
+
+
+def send_buffers(sock, buffers):
+    """Send the buffers back to back without joining them first.
+
+    Uses a gather write (``sendmsg``) where the platform has one; small
+    messages are joined instead, which costs less than the gather.
+    """
+    if not hasattr(sock, 'sendmsg') or sum(map(len, buffers)) < ZERO_COPY_MIN_SIZE:
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(buffer).cast('B') for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views[:MAX_SEND_BUFFERS])
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+def send_message(sock, header, payload=b''):
+    """Send one framed message (JSON header plus optional payload).
+
+    ``payload`` is a bytes-like object or a list of parts sent back to back
+    (see pack_items). A FilePayload part goes out with ``sendfile``, straight
+    from its file.
+    """
+    header_bytes = json.dumps(header).encode('utf-8')
+    if not isinstance(payload, (list, FilePayload)) and len(payload) < ZERO_COPY_MIN_SIZE:
+        sock.sendall(FRAME_PREFIX.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+        return
+    parts = payload if isinstance(payload, list) else [payload]
+    pending = [FRAME_PREFIX.pack(len(header_bytes), sum(map(len, parts))) + header_bytes]
+    try:
+        for part in parts:
+            if isinstance(part, FilePayload):
+                send_buffers(sock, pending)
+                pending = []
+                part.send(sock)
+            else:
+                pending.append(part)
+        send_buffers(sock, pending)
+    finally:
+        # Files not sent because the connection failed
+        for part in parts:
+            if isinstance(part, FilePayload):
+                part.close()
+
+
+def recv_message(sock):
+    """Receive one framed message as (header, payload), or None on EOF.
+
+    Header and payload are read with ``recv_into`` into one buffer
+    allocated for the frame. A large payload is a read-only memoryview of
+    it, so it reaches storage without being copied.
+    """
+    prefix = bytearray(FRAME_PREFIX.size)
+    if not recv_into_exact(sock, prefix):
+        return None
+    header_len, payload_len = FRAME_PREFIX.unpack(prefix)
+    if header_len > MAX_HEADER_SIZE or payload_len > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Frame too large ({header_len}+{payload_len} bytes)")
+    frame = bytearray(header_len + payload_len)
+    if not recv_into_exact(sock, frame):
+        raise ConnectionError("Connection closed mid-message")
+    if payload_len >= ZERO_COPY_MIN_SIZE:
+        payload = memoryview(frame).toreadonly()[header_len:]
+    else:
+        payload = bytes(frame[header_len:])
+    return json.loads(frame[:header_len]), payload
+
+
+def pack_items(entries, fields=None, join=True):
+    """Pack (file_number, xml_data) pairs into item descriptors and one payload.
+
+    ``fields`` optionally gives extra per-item descriptor fields (such as
+    ``topic`` and ``priority``), one dict per entry; ``file_number`` and
+    ``size`` in them are ignored, so old descriptors can be passed as-is.
+    With ``join=False`` the payload is the list of the items' own buffers,
+    which send_message writes out without copying them together.
+    """
+    items = [{'file_number': file_num, 'size': len(xml_data)} for file_num, xml_data in entries]
+    if fields is not None:
+        for item, extra in zip(items, fields):
+            for key, value in extra.items():
+                item.setdefault(key, value)
+    payloads = [xml_data for _, xml_data in entries]
+    return items, b''.join(payloads) if join else payloads
+
+
+def unpack_items(items, payload):
+    """Split a batch payload back into (file_number, xml_data) pairs.
+
+    ``payload`` may also be a list of per-item parts (see pack_items).
+    """
+    if isinstance(payload, list):
+        if [item['size'] for item in items] != [len(part) for part in payload]:
+            raise ValueError("Batch payload size does not match item sizes")
+        return [(item['file_number'], part) for item, part in zip(items, payload)]
+    entries = []
+    offset = 0
+    for item in items:
+        size = item['size']
+        entries.append((item['file_number'], payload[offset:offset + size]))
+        offset += size
+    if offset != len(payload):
+        raise ValueError("Batch payload size does not match item sizes")
+    return entries
+
+
+class BufferConnection:
+    """Client connection to the buffer server.
+
+    In persistent mode one socket is kept open and reused for every request;
+    otherwise a fresh connection is opened per request.
+    """
+
+    def __init__(self, host=HOST, port=BUFFER_PORT, persistent=True, codec=DEFAULT_CODEC):
+        self.host = host
+        self.port = port
+        self.persistent = persistent
+        self.codec = codec
+        self.sock = None
+
+    def connect(self):
+        """Open the underlying socket if it is not already open.
+
+        A non-default payload codec is negotiated with HELLO on every new
+        connection.
+        """
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.codec != DEFAULT_CODEC:
+                send_message(self.sock, {'command': 'HELLO', 'codecs': [self.codec]})
+                message = recv_message(self.sock)
+                if message is None or message[0].get('codec') != self.codec:
+                    self.close()
+                    raise ConnectionError(f"Server does not support codec {self.codec}")
+        return self.sock
+
+    def request(self, header, payload=b''):
+        """Send a request and return the (response, payload) pair."""
+        try:
+            sock = self.connect()
+            send_message(sock, header, payload)
+            message = recv_message(sock)
+            if message is None:
+                raise ConnectionError("Server closed the connection")
+            return message
+        except Exception:
+            self.close()
+            raise
+        finally:
+            if not self.persistent:
+                self.close()
+
+    def close(self):
+        """Close the underlying socket."""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
 
 class BufferServer:
     """Central buffer server managing the queue."""
     
-    def __init__(self, host=HOST, port=BUFFER_PORT, max_size=BUFFER_SIZE):
+    def __init__(self, host=HOST, port=BUFFER_PORT, max_size=BUFFER_SIZE,
+                 storage='file', shared_dir="shared_files_socket", storage_options=None,
+                 codec=DEFAULT_CODEC, metrics=False, metrics_port=None,
+                 aggregate=False, priorities=1, max_topics=64, high_watermark=None,
+                 low_watermark=None):
         self.host = host
         self.port = port
         self.max_size = max_size
-        self.buffer = []
+        # Flow control: producers are granted credits (free slots below the
+        # high watermark) in every PRODUCE response. A topic that reaches the
+        # high watermark grants none until it has drained to the low one
+        self.high_watermark = max_size if high_watermark is None else high_watermark
+        self.low_watermark = self.high_watermark if low_watermark is None else low_watermark
+        if not 0 <= self.low_watermark <= self.high_watermark <= max_size:
+            raise ValueError("Watermarks must satisfy 0 <= low <= high <= max_size")
+        self.throttled = set()  # topics above their low watermark after hitting the high one
+        self.shared_dir = shared_dir
+        # Format payloads are stored in; connections using another codec
+        # are transcoded on the way in and out
+        self.codec = get_codec(codec)
+        # 'file' keeps one XML file per item in shared_dir, 'memory' holds
+        # the payloads in a ring buffer and never touches the disk, and 'log'
+        # appends them to a durable segmented log recovered on restart.
+        # Items are queued on named topics of up to max_size items each, in
+        # `priorities` FIFO lanes per topic (see buffer_topics)
+        # File payloads are sent with sendfile straight from disk
+        storage_options = dict(storage_options or {})
+        if storage == 'file':
+            storage_options.setdefault('sendfile', True)
+        self.buffer = TopicBuffer(storage, max_size, shared_dir, priorities=priorities,
+                                  max_topics=max_topics, **storage_options)
         self.lock = threading.Lock()
+        # Blocking requests park on these instead of the client sleep-polling
+        self.not_full = threading.Condition(self.lock)
+        self.not_empty = threading.Condition(self.lock)
+        # Parked consumers subscribed to particular topics: notify(n) could
+        # pick one of them for an item on another topic, so while any are
+        # parked every wake-up goes to all waiters
+        self.filtered_waiters = 0
         self.running = True
-        self.shared_dir = "shared_files_socket"
-        Path(self.shared_dir).mkdir(exist_ok=True)
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        # Latency histograms and counters for STATS and, if metrics_port is
+        # set, a Prometheus endpoint. None when disabled, so the request path
+        # only pays for an ``is None`` check
+        self.metrics = (BufferMetrics(self.buffer.lane_sizes())
+                        if metrics or metrics_port else None)
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self._held_since = 0.0  # When the current lock holder acquired the lock
+        # Per-programme/per-course aggregates of the students handed to
+        # consumers, for STUDENT_STATS; costs one decode per consumed item
+        self.stats = StudentStats() if aggregate else None
+        # At-least-once delivery: an item consumed with a lease stays here
+        # (and keeps its place in the topic's capacity) until it is ACKed.
+        # Deadlines sit in a heap, so the reaper thread sleeps until the
+        # earliest one instead of scanning; ACKed entries are skipped lazily
+        self.leases = {}  # lease_id -> (topic, priority, file_num, payload, deliveries, deadline)
+        self.lease_heap = []  # (deadline, lease_id)
+        self.lease_ids = itertools.count(1)
+        self.inflight = Counter()  # topic -> leased items
+        self.lease_reaper = threading.Condition(self.lock)
+    
+    def process_request(self, request, payload=b''):
+        """Execute one request and return the (response, payload) pair.
+
+        PRODUCE and CONSUME (and their _MANY batch variants) accept ``block``
+        (wait for a free slot or an item instead of answering FULL/EMPTY) and
+        ``timeout`` (seconds, ``None`` waits indefinitely). Producing requests
+        name a ``topic`` (default ``'default'``) and ``priority`` (0 is served
+        first); consuming requests may list the ``topics`` they take from
+        (default: all).
+        """
+        command = request.get('command')
+        if self.metrics is None:
+            with self.lock:
+                return self._dispatch(command, request, payload)
+        
+        started = time.perf_counter()
+        with self.lock:
+            self._held_since = time.perf_counter()
+            self.metrics.lock_wait.observe(self._held_since - started)
+            try:
+                return self._dispatch(command, request, payload)
+            finally:
+                self.metrics.lock_hold.observe(time.perf_counter() - self._held_since)
+    
+    def _dispatch(self, command, request, payload):
+        """Run one command. Caller holds the lock."""
+        if command == 'PRODUCE':
+            return self._produce(request, payload)
+        elif command == 'CONSUME':
+            return self._consume(request)
+        elif command == 'PRODUCE_MANY':
+            return self._produce_many(request, payload)
+        elif command == 'CONSUME_MANY':
+            return self._consume_many(request)
+        elif command == 'STATUS':
+            return {
+                'status': 'SUCCESS',
+                'buffer_size': len(self.buffer),
+                'buffer_max': self.max_size,
+                'topics': self.buffer.topic_sizes(),
+                'credits': {topic: self.credits(topic) for topic in self.buffer.topic_sizes()},
+                'inflight': len(self.leases)
+            }, b''
+        elif command == 'STATS':
+            return self._stats(), b''
+        elif command == 'ACK':
+            return self._ack(request), b''
+        elif command == 'NACK':
+            return self._nack(request), b''
+        
+        return {
+            'status': 'ERROR',
+            'message': f'Unknown command: {command}'
+        }, b''
+    
+    def _stats(self):
+        """STATUS plus, when metrics are enabled, counters and latency summaries."""
+        stats = {
+            'status': 'SUCCESS',
+            'buffer_size': len(self.buffer),
+            'buffer_max': self.max_size,
+            'inflight': len(self.leases),
+            'metrics_enabled': self.metrics is not None
+        }
+        if self.metrics is not None:
+            stats.update(self.metrics.snapshot())
+        return stats
+    
+    def metrics_text(self):
+        """The server's metrics in the Prometheus text format."""
+        return self.metrics.render_prometheus({
+            'size': len(self.buffer),
+            'capacity': self.max_size,
+            'inflight': len(self.leases)
+        })
+    
+    def _start_metrics_server(self):
+        if self.metrics_port is not None:
+            self.metrics_server = start_metrics_server(self.metrics_text, self.host,
+                                                       self.metrics_port)
+            print(f"[BUFFER] Metrics on http://{self.host}:{self.metrics_port}/metrics")
+    
+    def _stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+    
+    def observe_request(self, request, response, started):
+        """Record a handled request with the metrics (if enabled)."""
+        if self.metrics is not None:
+            command = request.get('command') if isinstance(request, dict) else None
+            self.metrics.observe_request(command, response, time.perf_counter() - started)
+    
+    def handle_message(self, request, payload, session):
+        """Handle one request on a connection whose state is in ``session``.
+
+        HELLO negotiates the connection's payload codec. Payloads of other
+        requests are converted between that codec and the storage codec
+        outside the buffer lock, and only when the two differ. STUDENT_STATS
+        returns the consumed-student aggregates without taking the lock.
+        Malformed request fields get an ERROR reply before the lock is taken.
+        """
+        try:
+            self.check_request(request)
+        except ValueError as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        command = request.get('command')
+        if command == 'HELLO':
+            codec_name = negotiate_codec(request.get('codecs', []))
+            if codec_name is None:
+                return {'status': 'ERROR', 'message': 'No supported codec'}, b''
+            session['codec'] = get_codec(codec_name)
+            return {'status': 'SUCCESS', 'codec': codec_name}, b''
+        if command == 'STUDENT_STATS':
+            if self.stats is None:
+                return {'status': 'ERROR', 'message': 'Aggregation is disabled'}, b''
+            return dict(self.stats.snapshot(), status='SUCCESS'), b''
+        
+        wire_codec = session.setdefault('codec', get_codec(DEFAULT_CODEC))
+        if wire_codec is self.codec:
+            response, response_payload = self.process_request(request, payload)
+        else:
+            try:
+                request, payload = self._transcode_request(request, payload, wire_codec)
+            except Exception as e:
+                return {'status': 'ERROR', 'message': f'Undecodable payload: {e}'}, b''
+            response, response_payload = self.process_request(request, payload)
+        
+        if self.stats is None and wire_codec is self.codec:
+            return response, response_payload
+        # Both need the students, so payloads still on disk are read in
+        if isinstance(response_payload, list):
+            response_payload = [payload_bytes(part) for part in response_payload]
+        else:
+            response_payload = payload_bytes(response_payload)
+        if self.stats is not None:
+            self._aggregate(response, response_payload)
+        if wire_codec is self.codec:
+            return response, response_payload
+        return self._transcode_response(response, response_payload, wire_codec)
+    
+    def _aggregate(self, response, payload):
+        """Add the students of a successful CONSUME(_MANY) response to the stats.
+
+        Redelivered items (``deliveries`` above 1) were counted when they
+        were first handed out, so only first deliveries are added.
+        """
+        if response.get('status') != 'SUCCESS':
+            return
+        if 'file_number' in response and payload:
+            if response.get('deliveries', 1) == 1:
+                self.stats.add(self.codec.decode(payload))
+        elif 'items' in response:
+            for item, (_, data) in zip(response['items'],
+                                       unpack_items(response['items'], payload)):
+                if item.get('deliveries', 1) == 1:
+                    self.stats.add(self.codec.decode(data))
+    
+    def _transcode_request(self, request, payload, wire_codec):
+        """Convert PRODUCE payloads from the wire codec to the storage codec."""
+        command = request.get('command')
+        if command == 'PRODUCE':
+            payload = self.codec.encode(wire_codec.decode(payload))
+        elif command == 'PRODUCE_MANY':
+            items = request.get('items', [])
+            entries = [(file_num, self.codec.encode(wire_codec.decode(data)))
+                       for file_num, data in unpack_items(items, payload)]
+            items, payload = pack_items(entries, items)
+            request = dict(request, items=items)
+        return request, payload
+    
+    def _transcode_response(self, response, payload, wire_codec):
+        """Convert CONSUME payloads from the storage codec to the wire codec."""
+        if response.get('status') != 'SUCCESS':
+            return response, payload
+        if 'file_number' in response and payload:
+            payload = wire_codec.encode(self.codec.decode(payload))
+        elif 'items' in response:
+            entries = [(file_num, wire_codec.encode(self.codec.decode(data)))
+                       for file_num, data in unpack_items(response['items'], payload)]
+            items, payload = pack_items(entries, response['items'])
+            response = dict(response, items=items)
+        return response, payload
+    
+    def credits(self, topic=DEFAULT_TOPIC):
+        """How many more items ``topic`` accepts before its high watermark.
+
+        Leased (in-flight) items still count, so a redelivery always fits.
+        A throttled topic grants nothing until it is down to the low
+        watermark.
+        """
+        level = self.buffer.size(topic) + self.inflight[topic]
+        if topic in self.throttled:
+            if level > self.low_watermark:
+                return 0
+            self.throttled.discard(topic)
+        return max(0, self.high_watermark - level)
+    
+    def has_space(self, topic=DEFAULT_TOPIC):
+        """True if a PRODUCE to ``topic`` can be accepted right now."""
+        return self.running and self.credits(topic) > 0
+    
+    def wakes_all(self):
+        """True if a change must wake every waiter rather than ``n`` of them.
+
+        With several topics, or a consumer waiting on topics of its own
+        (possibly ones without a lane yet), a waiter may be waiting on a
+        different topic than the one that changed; with a low watermark
+        below the high one, every parked producer may go once a topic
+        drains to it.
+        """
+        return (self.filtered_waiters > 0 or len(self.buffer.lanes) > 1
+                or self.low_watermark < self.high_watermark)
+    
+    def has_item(self, topics=None):
+        """True if a CONSUME from ``topics`` (None: any) can be answered right now."""
+        return self.running and self.buffer.has_items(topics)
+    
+    @staticmethod
+    def check_request(request):
+        """Raise ValueError if the request's routing fields are malformed."""
+        if not isinstance(request, dict):
+            raise ValueError("Request header must be a JSON object")
+        if not isinstance(request.get('topic', DEFAULT_TOPIC), str):
+            raise ValueError("topic must be a string")
+        topics = request.get('topics')
+        if not (topics is None or isinstance(topics, str) or
+                isinstance(topics, list) and all(isinstance(topic, str) for topic in topics)):
+            raise ValueError("topics must be a string or a list of strings")
+        if request.get('command') == 'PRODUCE_MANY':
+            items = request.get('items', [])
+            if not (isinstance(items, list) and all(isinstance(item, dict) for item in items)):
+                raise ValueError("items must be a list of objects")
+            if not all(isinstance(item.get('topic', DEFAULT_TOPIC), str) for item in items):
+                raise ValueError("Item topics must be strings")
+    
+    @staticmethod
+    def produce_topics(request):
+        """The topics a PRODUCE request (or each item of a batch) goes to, in order."""
+        if request.get('command') == 'PRODUCE_MANY':
+            items = request.get('items') or [{}]
+            return list(dict.fromkeys(item.get('topic', DEFAULT_TOPIC) for item in items))
+        return [request.get('topic', DEFAULT_TOPIC)]
+    
+    @staticmethod
+    def request_topics(request):
+        """The set of topics a CONSUME request subscribes to, or None for all."""
+        topics = request.get('topics')
+        if isinstance(topics, str):
+            return {topics}
+        return set(topics) if topics else None
+    
+    def has_space_any(self, topics):
+        """True if any of ``topics`` can accept a PRODUCE right now."""
+        return any(self.has_space(topic) for topic in topics)
+    
+    def _wait_for_space(self, request, topics, timeout=None):
+        """Wait (if requested) for a free slot in any of ``topics``; return True if one is free."""
+        if request.get('block'):
+            self._block(self.not_full, lambda: self.has_space_any(topics) or not self.running,
+                        timeout)
+        return self.has_space_any(topics)
+    
+    def _wait_for_item(self, request, topics, timeout=None):
+        """Wait (if requested) for an item; return True if one is queued."""
+        if request.get('block'):
+            if topics is not None:
+                self.filtered_waiters += 1
+            try:
+                self._block(self.not_empty, lambda: self.has_item(topics) or not self.running,
+                            timeout)
+            finally:
+                if topics is not None:
+                    self.filtered_waiters -= 1
+        return self.has_item(topics)
+    
+    def _wake(self, condition, n):
+        """Wake waiters after ``n`` items or slots appeared. Caller holds the lock."""
+        if self.wakes_all():
+            condition.notify_all()
+        elif n:
+            condition.notify(n)
+    
+    def _block(self, condition, predicate, timeout):
+        """Wait on ``condition`` until ``predicate`` holds. Caller holds the lock.
+
+        With metrics enabled the wait is recorded as block_wait and splits
+        the lock hold time, since the lock is released while waiting.
+        """
+        if self.metrics is None or predicate():
+            condition.wait_for(predicate, timeout)
+            return
+        parked = time.perf_counter()
+        self.metrics.lock_hold.observe(parked - self._held_since)
+        condition.wait_for(predicate, timeout)
+        self._held_since = time.perf_counter()
+        self.metrics.block_wait.observe(self._held_since - parked)
+    
+    def _put_item(self, file_num, xml_data, topic=DEFAULT_TOPIC, priority=0):
+        """Append one item to a topic. Caller holds the lock.
+
+        Raises ValueError for an invalid topic name or too many topics.
+        """
+        priority = self.buffer.priority(priority)
+        self.buffer.append(file_num, xml_data, topic, priority)
+        if self.buffer.size(topic) + self.inflight[topic] >= self.high_watermark:
+            self.throttled.add(topic)
+        if self.metrics is not None:
+            self.metrics.enqueued((topic, priority))
+    
+    def _take_item(self, topics=None, lease=None):
+        """Pop the next item of ``topics``. Caller holds the lock.
+
+        Returns (topic, file_num, xml_data, lease_fields). ``xml_data`` is
+        None if the backing file has gone missing. With ``lease`` (seconds)
+        the item is leased rather than removed, and ``lease_fields`` holds
+        the ``lease_id`` and ``deliveries`` count for the response.
+        """
+        topic, priority, file_num, xml_data, deliveries = self.buffer.popleft(topics)
+        if self.metrics is not None:
+            self.metrics.dequeued((topic, priority), redelivery=deliveries > 0)
+        if lease is None or xml_data is None:
+            return topic, file_num, xml_data, {}
+        
+        # A leased payload is kept for redelivery, so it must be in memory
+        xml_data = payload_bytes(xml_data)
+        lease_id = next(self.lease_ids)
+        deadline = time.monotonic() + lease
+        self.leases[lease_id] = (topic, priority, file_num, xml_data, deliveries + 1, deadline)
+        self.inflight[topic] += 1
+        if not self.lease_heap or deadline < self.lease_heap[0][0]:
+            self.lease_reaper.notify()
+        heapq.heappush(self.lease_heap, (deadline, lease_id))
+        return topic, file_num, xml_data, {'lease_id': lease_id, 'deliveries': deliveries + 1}
+    
+    @staticmethod
+    def request_timeout(request):
+        """How long (seconds) a blocking request waits, or None for no limit."""
+        timeout = request.get('timeout')
+        if timeout is None:
+            return None
+        timeout = float(timeout)
+        if timeout != timeout:
+            raise ValueError(f"Invalid timeout: {timeout}")
+        return min(timeout, threading.TIMEOUT_MAX)
+    
+    @staticmethod
+    def request_lease(request):
+        """The lease (visibility timeout, seconds) a CONSUME asks for, or None."""
+        lease = request.get('lease')
+        if lease is None:
+            return None
+        lease = float(lease)
+        if not lease > 0:
+            raise ValueError(f"Invalid lease: {lease}")
+        return lease
+    
+    def _release(self, lease_ids, redeliver):
+        """Drop the given leases, requeueing their items if ``redeliver``.
+
+        Returns how many of the leases were still outstanding.
+        """
+        released = 0
+        for lease_id in lease_ids:
+            lease = self.leases.pop(lease_id, None)
+            if lease is None:
+                continue
+            topic, priority, file_num, xml_data, deliveries, _ = lease
+            self.inflight[topic] -= 1
+            if redeliver:
+                self.buffer.requeue(topic, priority, file_num, xml_data, deliveries)
+            released += 1
+        # Drop heap entries of released leases once they dominate the heap
+        if len(self.lease_heap) > 2 * len(self.leases) + 1024:
+            self.lease_heap = [(lease[5], lease_id) for lease_id, lease in self.leases.items()]
+            heapq.heapify(self.lease_heap)
+        return released
+    
+    @staticmethod
+    def _lease_ids(request):
+        """The ``lease_ids`` list (or single ``lease_id``) of an ACK/NACK.
+
+        Raises ValueError unless they are integers.
+        """
+        lease_ids = request.get('lease_ids')
+        if lease_ids is None:
+            lease_ids = [request.get('lease_id')]
+        if not (isinstance(lease_ids, list) and
+                all(isinstance(lease_id, int) and not isinstance(lease_id, bool)
+                    for lease_id in lease_ids)):
+            raise ValueError("lease_ids must be a list of integers (or lease_id an integer)")
+        return lease_ids
+    
+    def _ack(self, request):
+        """Finish leased items: they are removed for good."""
+        try:
+            lease_ids = self._lease_ids(request)
+        except ValueError as e:
+            return {'status': 'ERROR', 'message': str(e)}
+        acked = self._release(lease_ids, redeliver=False)
+        self._wake(self.not_full, acked)
+        if self.metrics is not None:
+            self.metrics.counters['acked'] += acked
+        return {'status': 'SUCCESS', 'acked': acked, 'unknown': len(lease_ids) - acked}
+    
+    def _nack(self, request):
+        """Give leased items back for immediate redelivery."""
+        try:
+            lease_ids = self._lease_ids(request)
+        except ValueError as e:
+            return {'status': 'ERROR', 'message': str(e)}
+        requeued = self._release(lease_ids, redeliver=True)
+        self._wake(self.not_empty, requeued)
+        return {'status': 'SUCCESS', 'requeued': requeued, 'unknown': len(lease_ids) - requeued}
+    
+    def _expire_leases(self):
+        """Requeue every lease past its deadline. Caller holds the lock."""
+        now = time.monotonic()
+        expired = []
+        while self.lease_heap and self.lease_heap[0][0] <= now:
+            _, lease_id = heapq.heappop(self.lease_heap)
+            if lease_id in self.leases:
+                expired.append(lease_id)
+        return self._release(expired, redeliver=True)
+    
+    def _leases_expired(self, n):
+        """Wake consumers for ``n`` redelivered items. Caller holds the lock."""
+        self._wake(self.not_empty, n)
+    
+    def _reap_leases(self):
+        """Reaper thread: redeliver items whose lease ran out."""
+        with self.lock:
+            while self.running:
+                expired = self._expire_leases()
+                if expired:
+                    print(f"[BUFFER] Lease expired, redelivering {expired} item(s)")
+                    self._leases_expired(expired)
+                timeout = self.lease_heap[0][0] - time.monotonic() if self.lease_heap else None
+                self.lease_reaper.wait(timeout)
+    
+    def _start_lease_reaper(self):
+        threading.Thread(target=self._reap_leases, name="LeaseReaper", daemon=True).start()
+    
+    def _produce(self, request, payload):
+        topic = request.get('topic', DEFAULT_TOPIC)
+        try:
+            timeout = self.request_timeout(request)
+        except (TypeError, ValueError) as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        if not self._wait_for_space(request, [topic], timeout):
+            return {
+                'status': 'FULL',
+                'message': 'Buffer is full',
+                'buffer_size': len(self.buffer),
+                'credits': 0
+            }, b''
+        
+        file_num = request.get('file_number')
+        try:
+            self._put_item(file_num, payload, topic, request.get('priority', 0))
+        except (TypeError, ValueError) as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        self._wake(self.not_empty, 1)
+        print(f"[BUFFER] Produced: student{file_num}.xml (Buffer: {len(self.buffer)}/{self.max_size})")
+        return {
+            'status': 'SUCCESS',
+            'message': f'Added student{file_num}.xml',
+            'buffer_size': len(self.buffer),
+            'credits': self.credits(topic)
+        }, b''
+    
+    def _consume(self, request):
+        topics = self.request_topics(request)
+        try:
+            lease = self.request_lease(request)
+            timeout = self.request_timeout(request)
+        except (TypeError, ValueError) as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        if not self._wait_for_item(request, topics, timeout):
+            return {
+                'status': 'EMPTY',
+                'message': 'Buffer is empty',
+                'buffer_size': len(self.buffer),
+                'inflight': len(self.leases)
+            }, b''
+        
+        topic, file_num, xml_data, lease_fields = self._take_item(topics, lease)
+        if not lease_fields:
+            self._wake(self.not_full, 1)
+        if xml_data is None:
+            return {
+                'status': 'ERROR',
+                'message': 'File not found'
+            }, b''
+        
+        print(f"[BUFFER] Consumed: student{file_num}.xml (Buffer: {len(self.buffer)}/{self.max_size})")
+        return {
+            'status': 'SUCCESS',
+            'file_number': file_num,
+            'topic': topic,
+            'buffer_size': len(self.buffer),
+            **lease_fields
+        }, xml_data
+    
+    def _produce_many(self, request, payload):
+        """Accept every item of the batch whose topic has room.
+
+        Items may carry their own ``topic`` and ``priority``. Once a topic is
+        full, it and its later items in the batch are skipped (so each
+        topic's items stay in order) while other topics still take theirs;
+        ``rejected`` lists the indexes of the items not accepted. A blocking
+        batch waits until any of its topics has room. ``credits`` in the
+        response is the smallest grant among the batch's topics.
+        """
+        items = request.get('items', [])
+        try:
+            entries = unpack_items(items, payload)
+            topics = self.produce_topics(request)
+        except (KeyError, TypeError, ValueError) as e:
+            return {'status': 'ERROR', 'message': f'Malformed batch: {e}'}, b''
+        try:
+            timeout = self.request_timeout(request)
+        except (TypeError, ValueError) as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        if not entries or not self._wait_for_space(request, topics, timeout):
+            return {
+                'status': 'FULL' if entries else 'SUCCESS',
+                'accepted': 0,
+                'rejected': list(range(len(entries))),
+                'buffer_size': len(self.buffer),
+                'credits': min(self.credits(topic) for topic in topics)
+            }, b''
+        
+        rejected = []
+        full = set()
+        error = None
+        for index, (item, (file_num, xml_data)) in enumerate(zip(items, entries)):
+            topic = item.get('topic', DEFAULT_TOPIC)
+            if topic in full or not self.has_space(topic):
+                full.add(topic)
+                rejected.append(index)
+                continue
+            try:
+                self._put_item(file_num, xml_data, topic, item.get('priority', 0))
+            except (TypeError, ValueError) as e:
+                error = str(e)
+                rejected.append(index)
+        accepted = len(entries) - len(rejected)
+        if error is not None and not accepted:
+            return {'status': 'ERROR', 'message': error}, b''
+        self._wake(self.not_empty, accepted)
+        print(f"[BUFFER] Produced {accepted}/{len(entries)} items (Buffer: {len(self.buffer)}/{self.max_size})")
+        return {
+            'status': 'SUCCESS',
+            'accepted': accepted,
+            'rejected': rejected,
+            'buffer_size': len(self.buffer),
+            'credits': min(self.credits(topic) for topic in topics)
+        }, b''
+    
+    def _consume_many(self, request):
+        """Pop up to ``max_items`` items in one response."""
+        topics = self.request_topics(request)
+        try:
+            max_items = max(1, int(request.get('max_items', 1)))
+            lease = self.request_lease(request)
+            timeout = self.request_timeout(request)
+        except (TypeError, ValueError) as e:
+            return {'status': 'ERROR', 'message': str(e)}, b''
+        if not self._wait_for_item(request, topics, timeout):
+            return {
+                'status': 'EMPTY',
+                'message': 'Buffer is empty',
+                'items': [],
+                'buffer_size': len(self.buffer),
+                'inflight': len(self.leases)
+            }, b''
+        
+        entries = []
+        fields = []
+        missing = 0
+        while self.buffer.has_items(topics) and len(entries) + missing < max_items:
+            topic, file_num, xml_data, lease_fields = self._take_item(topics, lease)
+            if xml_data is None:
+                missing += 1
+            else:
+                entries.append((file_num, xml_data))
+                fields.append(dict(lease_fields, topic=topic))
+        self._wake(self.not_full, missing if lease is not None else len(entries) + missing)
+        
+        print(f"[BUFFER] Consumed {len(entries)} items (Buffer: {len(self.buffer)}/{self.max_size})")
+        items, response_payload = pack_items(entries, fields, join=False)
+        return {
+            'status': 'SUCCESS',
+            'items': items,
+            'missing': missing,
+            'buffer_size': len(self.buffer)
+        }, response_payload
     
     def handle_client(self, client_socket, address):
-        """Handle client requests (producer or consumer)."""
+        """Serve framed requests from one client until it disconnects."""
+        with self.clients_lock:
+            self.clients.add(client_socket)
         try:
-            data = client_socket.recv(4096).decode('utf-8')
-            request = json.loads(data)
-            
-            command = request.get('command')
-            response = {}
-            
-            with self.lock:
-                if command == 'PRODUCE':
-                    if len(self.buffer) < self.max_size:
-                        file_num = request.get('file_number')
-                        xml_data = request.get('xml_data')
-                        
-                        # Save XML file
-                        filepath = os.path.join(self.shared_dir, f"student{file_num}.xml")
-                        with open(filepath, 'w', encoding='utf-8') as f:
-                            f.write(xml_data)
-                        
-                        self.buffer.append(file_num)
-                        response = {
-                            'status': 'SUCCESS',
-                            'message': f'Added student{file_num}.xml',
-                            'buffer_size': len(self.buffer)
-                        }
-                        print(f"[BUFFER] Produced: student{file_num}.xml (Buffer: {len(self.buffer)}/{self.max_size})")
-                    else:
-                        response = {
-                            'status': 'FULL',
-                            'message': 'Buffer is full',
-                            'buffer_size': len(self.buffer)
-                        }
-                
-                elif command == 'CONSUME':
-                    if self.buffer:
-                        file_num = self.buffer.pop(0)
-                        filepath = os.path.join(self.shared_dir, f"student{file_num}.xml")
-                        
-                        # Read XML file
-                        if os.path.exists(filepath):
-                            with open(filepath, 'r', encoding='utf-8') as f:
-                                xml_data = f.read()
-                            os.remove(filepath)
-                            
-                            response = {
-                                'status': 'SUCCESS',
-                                'file_number': file_num,
-                                'xml_data': xml_data,
-                                'buffer_size': len(self.buffer)
-                            }
-                            print(f"[BUFFER] Consumed: student{file_num}.xml (Buffer: {len(self.buffer)}/{self.max_size})")
-                        else:
-                            response = {
-                                'status': 'ERROR',
-                                'message': 'File not found'
-                            }
-                    else:
-                        response = {
-                            'status': 'EMPTY',
-                            'message': 'Buffer is empty',
-                            'buffer_size': 0
-                        }
-                
-                elif command == 'STATUS':
-                    response = {
-                        'status': 'SUCCESS',
-                        'buffer_size': len(self.buffer),
-                        'buffer_max': self.max_size
-                    }
-            
-            client_socket.send(json.dumps(response).encode('utf-8'))
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = {}
+            while self.running:
+                message = recv_message(client_socket)
+                if message is None:
+                    break
+                request, payload = message
+                started = time.perf_counter()
+                try:
+                    response, response_payload = self.handle_message(request, payload, session)
+                except Exception as e:
+                    # One bad request must not cost the client its connection
+                    print(f"[BUFFER] Error handling request: {e!r}")
+                    response, response_payload = {'status': 'ERROR', 'message': str(e)}, b''
+                self.observe_request(request, response, started)
+                send_message(client_socket, response, response_payload)
             
         except Exception as e:
-            print(f"[BUFFER] Error: {e}")
+            if self.running:
+                print(f"[BUFFER] Error: {e}")
         finally:
+            with self.clients_lock:
+                self.clients.discard(client_socket)
             client_socket.close()
     
     def start(self):
@@ -111,17 +926,21 @@ class BufferServer:
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((self.host, self.port))
-        server_socket.listen(5)
+        server_socket.listen(128)
         server_socket.settimeout(1.0)
         
         print(f"[BUFFER] Server started on {self.host}:{self.port}")
+        self._start_metrics_server()
+        self._start_lease_reaper()
         
         while self.running:
             try:
                 client_socket, address = server_socket.accept()
+                client_socket.settimeout(None)
                 client_thread = threading.Thread(
                     target=self.handle_client,
-                    args=(client_socket, address)
+                    args=(client_socket, address),
+                    daemon=True
                 )
                 client_thread.start()
             except socket.timeout:
@@ -131,144 +950,409 @@ class BufferServer:
                     print(f"[BUFFER] Error: {e}")
         
         server_socket.close()
+        self._stop_metrics_server()
+        self.buffer.close()
         print("[BUFFER] Server stopped")
+    
+    def stop(self):
+        """Stop accepting connections and disconnect persistent clients."""
+        with self.lock:
+            self.running = False
+            self.not_full.notify_all()
+            self.not_empty.notify_all()
+            self.lease_reaper.notify_all()
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client_socket in clients:
+            try:
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 
-class Producer:
-    """Producer client that generates and sends student data."""
+class CreditPacer:
+    """Adaptive pacing of a producer from the credits the server grants.
+
+    Every PRODUCE response advertises ``credits``, the free slots below the
+    server's high watermark. Batches are cut to the last grant, and a
+    producer without credits backs off instead of sending into a full
+    buffer: the delay doubles while nothing is granted (up to ``max_delay``)
+    and halves on every accepted request, so it settles near the rate at
+    which consumers drain the buffer.
+    """
+    
+    def __init__(self, min_delay=0.01, max_delay=1.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+        self.credits = None  # Unknown until the first response
+    
+    def update(self, response):
+        """Take the grant (and success or rejection) from a PRODUCE response."""
+        status = response.get('status')
+        self.credits = response.get('credits', 0 if status == 'FULL' else self.credits)
+        if status == 'SUCCESS' and response.get('accepted', 1):
+            self.delay = max(self.min_delay, self.delay / 2)
     
-    def __init__(self, buffer_host=HOST, buffer_port=BUFFER_PORT, count=10):
+    @property
+    def starved(self):
+        return self.credits == 0
+    
+    def allowance(self, wanted):
+        """How many of ``wanted`` items to send next (always at least one)."""
+        if self.credits is None:
+            return wanted
+        return max(1, min(wanted, self.credits))
+    
+    def backoff(self):
+        """Seconds to wait for credits; each call doubles the next wait."""
+        delay = self.delay
+        self.delay = min(self.max_delay, self.delay * 2)
+        return delay
+
+
+class StudentSource:
+    """Where a producer client's students come from and which topic and
+    priority each one is sent with; shared by Producer and AsyncProducer.
+    """
+    
+    def __init__(self, topic_key=None, priority_key=None, seed=None, worker=0):
+        # Optional functions of the student choosing its topic and priority
+        # (e.g. buffer_topics.by_programme and buffer_topics.failing_first)
+        self.topic_key = topic_key
+        self.priority_key = priority_key
+        # With a seed, students come in bulk from a StudentGenerator, so runs
+        # are reproducible; producers with different worker numbers draw
+        # different students
+        self.generator = None if seed is None else StudentGenerator(seed, worker=worker)
+    
+    def routing(self, student):
+        """The ``topic``/``priority`` request fields for a student."""
+        fields = {}
+        if self.topic_key is not None:
+            fields['topic'] = self.topic_key(student)
+        if self.priority_key is not None:
+            fields['priority'] = self.priority_key(student)
+        return fields
+    
+    def students(self):
+        """Endless supply of students to send (seeded: from the generator)."""
+        if self.generator is None:
+            while True:
+                yield ITStudent()
+        while True:
+            yield from self.generator.generate(GENERATOR_CHUNK)
+
+
+class Producer(StudentSource):
+    """Producer client that generates and sends student data.
+
+    Non-blocking producers pace themselves with a CreditPacer instead of
+    sleeping a fixed second whenever the buffer is full.
+    """
+    
+    def __init__(self, buffer_host=HOST, buffer_port=BUFFER_PORT, count=10,
+                 persistent=True, blocking=True, block_timeout=BLOCK_TIMEOUT,
+                 batch_size=1, codec=DEFAULT_CODEC, first_number=1,
+                 produce_delay=(0.5, 1.5), topic_key=None, priority_key=None, seed=None):
         self.buffer_host = buffer_host
         self.buffer_port = buffer_port
         self.count = count
+        self.first_number = first_number  # Lets several producers number disjointly
+        self.blocking = blocking
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.produce_delay = produce_delay  # (min, max) seconds, None disables
+        # Producers numbering disjointly also draw different seeded students
+        super().__init__(topic_key, priority_key, seed, worker=first_number)
+        self.codec = get_codec(codec)
+        self.pacer = CreditPacer()
+        self.connection = BufferConnection(buffer_host, buffer_port, persistent, codec)
     
-    def send_request(self, request):
-        """Send request to buffer server."""
+    def send_request(self, request, payload=b''):
+        """Send request to buffer server and return (response, payload)."""
         try:
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((self.buffer_host, self.buffer_port))
-            client_socket.send(json.dumps(request).encode('utf-8'))
-            response = client_socket.recv(4096).decode('utf-8')
-            client_socket.close()
-            return json.loads(response)
+            return self.connection.request(request, payload)
         except Exception as e:
             print(f"[PRODUCER] Connection error: {e}")
-            return {'status': 'ERROR', 'message': str(e)}
+            return {'status': 'ERROR', 'message': str(e)}, b''
     
     def produce(self):
         """Produce student data."""
+        if self.batch_size > 1:
+            return self.produce_batches()
+        
         print("[PRODUCER] Started")
         
-        for i in range(1, self.count + 1):
+        students = self.students()
+        for i in range(self.first_number, self.first_number + self.count):
             # Generate student
-            student = ITStudent()
-            xml_data = student.to_xml()
+            student = next(students)
+            data = self.codec.encode(student)
             
             # Try to add to buffer
             while True:
+                if self.pacer.starved and not self.blocking:
+                    time.sleep(self.pacer.backoff())
                 request = {
                     'command': 'PRODUCE',
                     'file_number': i,
-                    'xml_data': xml_data
+                    'block': self.blocking,
+                    'timeout': self.block_timeout,
+                    **self.routing(student)
                 }
-                response = self.send_request(request)
+                response, _ = self.send_request(request, data)
+                self.pacer.update(response)
                 
                 if response['status'] == 'SUCCESS':
                     print(f"[PRODUCER] Produced student{i}.xml")
                     break
                 elif response['status'] == 'FULL':
                     print(f"[PRODUCER] Buffer full, waiting...")
-                    time.sleep(1)
                 else:
                     print(f"[PRODUCER] Error: {response.get('message')}")
                     break
             
-            time.sleep(random.uniform(0.5, 1.5))
+            if self.produce_delay:
+                time.sleep(random.uniform(*self.produce_delay))
         
+        self.connection.close()
+        print("[PRODUCER] Finished")
+    
+    def produce_batches(self):
+        """Produce student data in PRODUCE_MANY batches of `batch_size`."""
+        print(f"[PRODUCER] Started (batch size {self.batch_size})")
+        
+        end = self.first_number + self.count
+        source = self.students()
+        for first in range(self.first_number, end, self.batch_size):
+            last = min(first + self.batch_size, end)
+            if self.generator is not None and not (self.topic_key or self.priority_key):
+                # No routing needs the student objects: draw the batch
+                # straight into one pre-serialized payload
+                pending = unpack_items(*self.generator.serialize(last - first, self.codec, first))
+                fields = [{}] * len(pending)
+            else:
+                students = list(itertools.islice(source, last - first))
+                pending = [(i, self.codec.encode(student))
+                           for i, student in zip(range(first, last), students)]
+                fields = [self.routing(student) for student in students]
+            
+            # Send as much as the server has granted credits for, until the
+            # whole batch is in
+            while pending:
+                if self.pacer.starved and not self.blocking:
+                    time.sleep(self.pacer.backoff())
+                n = self.pacer.allowance(len(pending))
+                items, payload = pack_items(pending[:n], fields[:n])
+                request = {
+                    'command': 'PRODUCE_MANY',
+                    'items': items,
+                    'block': self.blocking,
+                    'timeout': self.block_timeout
+                }
+                response, _ = self.send_request(request, payload)
+                self.pacer.update(response)
+                
+                if response['status'] in ('SUCCESS', 'FULL'):
+                    # Items of full topics are sent again, still in order
+                    rejected = response['rejected']
+                    if len(rejected) < n:
+                        print(f"[PRODUCER] Produced {n - len(rejected)} of student{pending[0][0]}.xml"
+                              f" to student{pending[n - 1][0]}.xml")
+                    pending = [pending[k] for k in rejected] + pending[n:]
+                    fields = [fields[k] for k in rejected] + fields[n:]
+                else:
+                    print(f"[PRODUCER] Error: {response.get('message')}")
+                    break
+        
+        self.connection.close()
         print("[PRODUCER] Finished")
 
 
 class Consumer:
     """Consumer client that reads and processes student data."""
     
-    def __init__(self, buffer_host=HOST, buffer_port=BUFFER_PORT, count=10):
+    def __init__(self, buffer_host=HOST, buffer_port=BUFFER_PORT, count=10,
+                 persistent=True, blocking=True, block_timeout=BLOCK_TIMEOUT,
+                 batch_size=1, codec=DEFAULT_CODEC, consume_delay=(1.0, 2.0),
+                 sink='console', sink_options=None, topics=None, lease=None):
         self.buffer_host = buffer_host
         self.buffer_port = buffer_port
         self.count = count
+        self.blocking = blocking
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.consume_delay = consume_delay  # (min, max) seconds, None disables
+        self.topics = topics  # Topics to take from, served round-robin (None: all)
+        # Seconds to lease each item for (ACKed once emitted); None takes
+        # items outright (at-most-once)
+        self.lease = lease
+        self.codec = get_codec(codec)
         self.consumed = 0
+        # A sink name (see result_sinks) is created and closed by this
+        # consumer; a sink object can be shared and is closed by its owner
+        self.owns_sink = isinstance(sink, str)
+        self.sink = create_sink(sink, **(sink_options or {})) if self.owns_sink else sink
+        self.connection = BufferConnection(buffer_host, buffer_port, persistent, codec)
+    
+    def close(self):
+        """Close the connection and, if this consumer created it, the sink."""
+        self.connection.close()
+        if self.owns_sink:
+            self.sink.close()
     
-    def send_request(self, request):
-        """Send request to buffer server."""
+    def send_request(self, request, payload=b''):
+        """Send request to buffer server and return (response, payload)."""
         try:
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((self.buffer_host, self.buffer_port))
-            client_socket.send(json.dumps(request).encode('utf-8'))
-            response = client_socket.recv(8192).decode('utf-8')
-            client_socket.close()
-            return json.loads(response)
+            return self.connection.request(request, payload)
         except Exception as e:
             print(f"[CONSUMER] Connection error: {e}")
-            return {'status': 'ERROR', 'message': str(e)}
+            return {'status': 'ERROR', 'message': str(e)}, b''
+    
+    def ack(self, lease_ids):
+        """Acknowledge leased items so the server does not redeliver them."""
+        if lease_ids:
+            response, _ = self.send_request({'command': 'ACK', 'lease_ids': lease_ids})
+            if response.get('unknown'):
+                print(f"[CONSUMER] {response['unknown']} lease(s) had already expired")
     
     def consume(self):
         """Consume student data."""
+        if self.batch_size > 1:
+            return self.consume_batches()
+        
         print("[CONSUMER] Started")
         
         while self.consumed < self.count:
-            request = {'command': 'CONSUME'}
-            response = self.send_request(request)
+            request = {
+                'command': 'CONSUME',
+                'block': self.blocking,
+                'timeout': self.block_timeout
+            }
+            if self.topics:
+                request['topics'] = list(self.topics)
+            if self.lease is not None:
+                request['lease'] = self.lease
+            response, data = self.send_request(request)
             
             if response['status'] == 'SUCCESS':
-                xml_data = response['xml_data']
                 file_num = response['file_number']
                 
                 # Process student
-                student = ITStudent.from_xml(xml_data)
+                student = self.codec.decode(data)
                 print(f"[CONSUMER] Consumed student{file_num}.xml")
-                student.display_info()
+                self.sink.emit(student, file_num)
+                if 'lease_id' in response:
+                    self.ack([response['lease_id']])
                 
                 self.consumed += 1
             elif response['status'] == 'EMPTY':
                 print(f"[CONSUMER] Buffer empty, waiting...")
-                time.sleep(1)
+                if not self.blocking:
+                    time.sleep(1)
+                continue
             else:
                 print(f"[CONSUMER] Error: {response.get('message')}")
                 time.sleep(1)
             
-            time.sleep(random.uniform(1.0, 2.0))
+            if self.consume_delay:
+                time.sleep(random.uniform(*self.consume_delay))
         
+        self.close()
+        print(f"[CONSUMER] Finished (Processed {self.consumed} students)")
+    
+    def consume_batches(self):
+        """Consume student data in CONSUME_MANY batches of up to `batch_size`."""
+        print(f"[CONSUMER] Started (batch size {self.batch_size})")
+        
+        while self.consumed < self.count:
+            request = {
+                'command': 'CONSUME_MANY',
+                'max_items': min(self.batch_size, self.count - self.consumed),
+                'block': self.blocking,
+                'timeout': self.block_timeout
+            }
+            if self.topics:
+                request['topics'] = list(self.topics)
+            if self.lease is not None:
+                request['lease'] = self.lease
+            response, payload = self.send_request(request)
+            
+            if response['status'] == 'SUCCESS':
+                for file_num, data in unpack_items(response['items'], payload):
+                    student = self.codec.decode(data)
+                    print(f"[CONSUMER] Consumed student{file_num}.xml")
+                    self.sink.emit(student, file_num)
+                    self.consumed += 1
+                self.ack([item['lease_id'] for item in response['items'] if 'lease_id' in item])
+                if response.get('missing'):
+                    print(f"[CONSUMER] Error: {response['missing']} file(s) not found")
+            elif response['status'] == 'EMPTY':
+                print(f"[CONSUMER] Buffer empty, waiting...")
+                if not self.blocking:
+                    time.sleep(1)
+            else:
+                print(f"[CONSUMER] Error: {response.get('message')}")
+                time.sleep(1)
+        
+        self.close()
         print(f"[CONSUMER] Finished (Processed {self.consumed} students)")
 
 
-def run_socket_system():
-    """Run the complete socket-based producer-consumer system."""
+def run_socket_system(persistent=True, batch_size=1, engine='thread',
+                      storage='file', codec=DEFAULT_CODEC, sink='console'):
+    """Run the complete socket-based producer-consumer system.
+
+    ``engine`` selects the buffer server and clients: ``'thread'`` (one
+    thread per connection) or ``'asyncio'`` (a single event loop).
+    ``storage`` selects the buffer backend: ``'file'``, ``'memory'`` or ``'log'``.
+    ``codec`` is the payload format the clients negotiate (see student_codecs).
+    ``sink`` is where the consumer sends students (see result_sinks).
+    """
     print("\n" + "="*60)
     print("SOCKET-BASED PRODUCER-CONSUMER SYSTEM")
     print("="*60 + "\n")
     
+    if engine == 'asyncio':
+        from async_socket_producer_consumer import (
+            AsyncBufferServer, AsyncProducer, AsyncConsumer, run_async_clients
+        )
+        buffer_server = AsyncBufferServer(storage=storage)
+    elif engine == 'thread':
+        buffer_server = BufferServer(storage=storage)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    
     # Start buffer server
-    buffer_server = BufferServer()
     buffer_thread = threading.Thread(target=buffer_server.start)
     buffer_thread.start()
     
     time.sleep(1)  # Wait for server to start
     
-    # Start producer and consumer
-    producer = Producer(count=10)
-    consumer = Consumer(count=10)
-    
-    producer_thread = threading.Thread(target=producer.produce)
-    consumer_thread = threading.Thread(target=consumer.consume)
-    
-    producer_thread.start()
-    consumer_thread.start()
-    
-    # Wait for completion
-    producer_thread.join()
-    consumer_thread.join()
+    if engine == 'asyncio':
+        producer = AsyncProducer(count=10, codec=codec)
+        consumer = AsyncConsumer(count=10, codec=codec, sink=sink)
+        asyncio.run(run_async_clients([producer], [consumer]))
+    else:
+        # Start producer and consumer
+        producer = Producer(count=10, persistent=persistent, batch_size=batch_size,
+                            codec=codec)
+        consumer = Consumer(count=10, persistent=persistent, batch_size=batch_size,
+                            codec=codec, sink=sink)
+        
+        producer_thread = threading.Thread(target=producer.produce)
+        consumer_thread = threading.Thread(target=consumer.consume)
+        
+        producer_thread.start()
+        consumer_thread.start()
+        
+        # Wait for completion
+        producer_thread.join()
+        consumer_thread.join()
     
     # Stop buffer server
-    buffer_server.running = False
+    buffer_server.stop()
     buffer_thread.join()
     
     print("\n" + "="*60)
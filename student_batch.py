@@ -0,0 +1,119 @@
+import sys
+from array import array
+
+from it_student import ITStudent
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+
+class StudentBatch:
+    """Columnar container for many students.
+
+    Instead of one ITStudent (and one courses dict) per record, the batch
+    keeps each field in a typed array: numeric student IDs, programme codes,
+    and the courses of every student as one flat run of course codes and
+    marks delimited by ``offsets`` (student ``i`` owns
+    ``offsets[i]:offsets[i + 1]``). Programmes and courses are coded by
+    their index in a vocabulary that starts from ITStudent.PROGRAMMES /
+    ITStudent.COURSES and grows when an unknown name is appended.
+    """
+
+    def __init__(self, students=()):
+        self.names = []
+        self.student_ids = array('I')
+        self.programme_codes = array('B')
+        self.offsets = array('I', [0])
+        self.course_codes = array('B')
+        self.marks = array('B')
+        self.programmes = list(ITStudent.PROGRAMMES)
+        self.courses = list(ITStudent.COURSES)
+        self.programme_index = {name: code for code, name in enumerate(self.programmes)}
+        self.course_index = {name: code for code, name in enumerate(self.courses)}
+        self.extend(students)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @staticmethod
+    def _code(name, vocabulary, index):
+        code = index.get(name)
+        if code is None:
+            if len(vocabulary) > 0xFF:
+                raise ValueError(f"Too many distinct values to encode: {name}")
+            code = index[name] = len(vocabulary)
+            vocabulary.append(name)
+        return code
+
+    def append(self, student):
+        """Add one ITStudent to the batch."""
+        if not student.student_id.isdigit():
+            raise ValueError(f"Non-numeric student ID: {student.student_id}")
+        self.names.append(sys.intern(student.student_name))
+        self.student_ids.append(int(student.student_id))
+        self.programme_codes.append(
+            self._code(student.programme, self.programmes, self.programme_index))
+        for course_name, mark in student.courses.items():
+            self.course_codes.append(self._code(course_name, self.courses, self.course_index))
+            self.marks.append(mark)
+        self.offsets.append(len(self.marks))
+
+    def extend(self, students):
+        """Add several students to the batch."""
+        for student in students:
+            self.append(student)
+
+    def __getitem__(self, i):
+        """Rebuild student ``i`` as an ITStudent."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("student index out of range")
+        student = ITStudent.__new__(ITStudent)
+        student.student_name = self.names[i]
+        student.student_id = f"{self.student_ids[i]:08d}"
+        student.programme = self.programmes[self.programme_codes[i]]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        student.courses = {
+            self.courses[code]: mark
+            for code, mark in zip(self.course_codes[start:end], self.marks[start:end])
+        }
+        return student
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def calculate_averages(self):
+        """Average mark of every student, as ITStudent.calculate_average."""
+        if np is not None and len(self):
+            offsets = np.frombuffer(self.offsets, dtype=np.uint32).astype(np.int64)
+            counts = np.diff(offsets)
+            totals = np.concatenate(([0], np.cumsum(np.frombuffer(self.marks, dtype=np.uint8),
+                                                     dtype=np.int64)))
+            sums = totals[offsets[1:]] - totals[offsets[:-1]]
+            averages = np.zeros(len(self), dtype=np.float64)
+            np.divide(sums, counts, out=averages, where=counts > 0)
+            return averages
+
+        averages = array('d')
+        marks = self.marks
+        for start, end in zip(self.offsets, self.offsets[1:]):
+            averages.append(sum(marks[start:end]) / (end - start) if end > start else 0)
+        return averages
+
+    def determine_pass_fail(self):
+        """PASS/FAIL of every student, as ITStudent.determine_pass_fail."""
+        averages = self.calculate_averages()
+        if np is not None and len(self):
+            return np.where(averages >= 50, "PASS", "FAIL").tolist()
+        return ["PASS" if average >= 50 else "FAIL" for average in averages]
+
+    def memory_usage(self):
+        """Approximate bytes held by the batch's own arrays and lists."""
+        arrays = (self.student_ids, self.programme_codes, self.offsets,
+                  self.course_codes, self.marks)
+        return (sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+                + sys.getsizeof(self.names))
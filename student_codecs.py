@@ -0,0 +1,187 @@
+import json
+import struct
+
+from it_student import ITStudent
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+def _make_student(name, student_id, programme, courses):
+    student = ITStudent.__new__(ITStudent)
+    student.student_name = name
+    student.student_id = student_id
+    student.programme = programme
+    student.courses = courses
+    return student
+
+
+class XMLCodec:
+    """The original XML document format (compact layout)."""
+
+    name = 'xml'
+
+    def encode(self, student):
+        return student.to_xml().encode('utf-8')
+
+    def decode(self, data):
+        return ITStudent.from_xml(data)
+
+
+class JSONCodec:
+    """Compact JSON object with the student's fields."""
+
+    name = 'json'
+
+    def encode(self, student):
+        return json.dumps({
+            'name': student.student_name,
+            'student_id': student.student_id,
+            'programme': student.programme,
+            'courses': student.courses
+        }, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        # json only parses str, bytes and bytearray, not received memoryviews
+        record = json.loads(data if not isinstance(data, memoryview) else bytes(data))
+        return _make_student(record['name'], record['student_id'],
+                             record['programme'], record['courses'])
+
+
+class MsgpackCodec:
+    """MessagePack array of the student's fields (needs the msgpack package)."""
+
+    name = 'msgpack'
+
+    def encode(self, student):
+        return msgpack.packb([student.student_name, student.student_id,
+                              student.programme, student.courses])
+
+    def decode(self, data):
+        name, student_id, programme, courses = msgpack.unpackb(data)
+        return _make_student(name, student_id, programme, courses)
+
+
+class BinaryCodec:
+    """Struct-packed record with dictionary-encoded programme and courses.
+
+    Layout: flags, programme code and course count (one byte each), the
+    student ID (uint32 when it is numeric, otherwise a string), the name,
+    then one (course code, mark) byte pair per course. Programmes and courses
+    are coded by their index in ITStudent.PROGRAMMES / ITStudent.COURSES;
+    the code LITERAL means a length-prefixed UTF-8 string follows instead.
+    """
+
+    name = 'binary'
+    LITERAL = 0xFF
+    NUMERIC_ID = 0x01
+    HEADER = struct.Struct('!BBB')
+    STUDENT_ID = struct.Struct('!I')
+    COURSE = struct.Struct('!BB')
+
+    def __init__(self, programmes=ITStudent.PROGRAMMES, courses=ITStudent.COURSES):
+        self.programmes = list(programmes)
+        self.courses = list(courses)
+        self.programme_codes = {name: code for code, name in enumerate(self.programmes)}
+        self.course_codes = {name: code for code, name in enumerate(self.courses)}
+
+    @staticmethod
+    def _pack_str(value):
+        data = value.encode('utf-8')
+        if len(data) > 0xFF:
+            raise ValueError(f"String too long for binary codec: {value[:20]}...")
+        return bytes((len(data),)) + data
+
+    @staticmethod
+    def _unpack_str(data, offset):
+        end = offset + 1 + data[offset]
+        return bytes(data[offset + 1:end]).decode('utf-8'), end
+
+    def encode(self, student):
+        flags = 0
+        student_id = student.student_id
+        if student_id.isdigit() and len(student_id) == 8:
+            flags |= self.NUMERIC_ID
+        programme_code = self.programme_codes.get(student.programme, self.LITERAL)
+        if len(student.courses) > 0xFF:
+            raise ValueError("Too many courses for binary codec")
+
+        parts = [self.HEADER.pack(flags, programme_code, len(student.courses))]
+        if flags & self.NUMERIC_ID:
+            parts.append(self.STUDENT_ID.pack(int(student_id)))
+        else:
+            parts.append(self._pack_str(student_id))
+        parts.append(self._pack_str(student.student_name))
+        if programme_code == self.LITERAL:
+            parts.append(self._pack_str(student.programme))
+
+        for course_name, mark in student.courses.items():
+            course_code = self.course_codes.get(course_name, self.LITERAL)
+            parts.append(self.COURSE.pack(course_code, mark))
+            if course_code == self.LITERAL:
+                parts.append(self._pack_str(course_name))
+        return b''.join(parts)
+
+    def decode(self, data):
+        flags, programme_code, num_courses = self.HEADER.unpack_from(data, 0)
+        offset = self.HEADER.size
+        if flags & self.NUMERIC_ID:
+            student_id = f"{self.STUDENT_ID.unpack_from(data, offset)[0]:08d}"
+            offset += self.STUDENT_ID.size
+        else:
+            student_id, offset = self._unpack_str(data, offset)
+        name, offset = self._unpack_str(data, offset)
+        if programme_code == self.LITERAL:
+            programme, offset = self._unpack_str(data, offset)
+        else:
+            programme = self.programmes[programme_code]
+
+        courses = {}
+        for _ in range(num_courses):
+            course_code, mark = self.COURSE.unpack_from(data, offset)
+            offset += self.COURSE.size
+            if course_code == self.LITERAL:
+                course_name, offset = self._unpack_str(data, offset)
+            else:
+                course_name = self.courses[course_code]
+            courses[course_name] = mark
+        return _make_student(name, student_id, programme, courses)
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    """Make a codec available by its ``name``."""
+    CODECS[codec.name] = codec
+
+
+def get_codec(name):
+    """Look up a registered codec by name."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown codec: {name}") from None
+
+
+def available_codecs():
+    """Names of the registered codecs."""
+    return list(CODECS)
+
+
+def negotiate_codec(preferred, supported=None):
+    """Pick the first of the client's preferred codecs that is supported."""
+    supported = CODECS if supported is None else supported
+    for name in preferred:
+        if name in supported:
+            return name
+    return None
+
+
+register_codec(XMLCodec())
+register_codec(JSONCodec())
+register_codec(BinaryCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
@@ -0,0 +1,193 @@
+import random
+import struct
+import sys
+from xml.sax.saxutils import escape
+
+from it_student import ITStudent
+from student_batch import StudentBatch
+from student_codecs import BinaryCodec, get_codec
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+# The ranges ITStudent() draws from
+MIN_STUDENT_ID, MAX_STUDENT_ID = 10000000, 99999999
+MIN_COURSES, MAX_COURSES = 4, 6
+MIN_MARK, MAX_MARK = 30, 100
+
+# Picking a full name uniformly is the same as picking first and last name
+# independently, with one draw instead of two
+NAMES = [sys.intern(f"{first} {last}")
+         for first in ITStudent.FIRST_NAMES for last in ITStudent.LAST_NAMES]
+
+
+class StudentGenerator:
+    """Bulk generator of synthetic students, reproducible from a seed.
+
+    Students are drawn with the same distribution as ``ITStudent()``, but
+    many at a time and straight into the columns of a StudentBatch, with
+    NumPy (when installed) drawing each field for the whole batch in one
+    call. Every generator has its own RNG derived from ``seed`` and
+    ``worker``, so parallel workers neither share the global random state
+    nor repeat each other, and the same seed, worker and sequence of batch
+    sizes always give the same students. The NumPy and pure-Python paths
+    produce different sequences. ``seed=None`` seeds from the OS.
+    """
+
+    def __init__(self, seed=None, worker=0, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = np is not None
+        elif use_numpy and np is None:
+            raise ImportError("use_numpy=True needs the numpy package")
+        self.seed = seed
+        self.worker = worker
+        self.use_numpy = use_numpy
+        if use_numpy:
+            self.rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(worker,)))
+        else:
+            self.rng = random.Random(None if seed is None else f"{seed}:{worker}")
+
+    def generate(self, n):
+        """Draw ``n`` students as a StudentBatch."""
+        batch = StudentBatch()
+        if n > 0:
+            if self.use_numpy:
+                self._fill_numpy(batch, n)
+            else:
+                self._fill_python(batch, n)
+        return batch
+
+    def students(self, n):
+        """Draw ``n`` students as ITStudent objects."""
+        return list(self.generate(n))
+
+    def _fill_numpy(self, batch, n):
+        rng = self.rng
+        names = rng.integers(0, len(NAMES), n)
+        batch.names.extend(np.array(NAMES, dtype=object)[names].tolist())
+        batch.student_ids.frombytes(
+            rng.integers(MIN_STUDENT_ID, MAX_STUDENT_ID + 1, n, dtype=np.uint32).tobytes())
+        batch.programme_codes.frombytes(
+            rng.integers(0, len(ITStudent.PROGRAMMES), n, dtype=np.uint8).tobytes())
+
+        # Each row of a random permutation of the course codes, cut to the
+        # student's course count, is a sample without replacement
+        counts = rng.integers(MIN_COURSES, MAX_COURSES + 1, n)
+        order = rng.random((n, len(ITStudent.COURSES))).argsort(axis=1)[:, :MAX_COURSES]
+        taken = np.arange(MAX_COURSES) < counts[:, None]
+        batch.course_codes.frombytes(order[taken].astype(np.uint8).tobytes())
+        batch.marks.frombytes(
+            rng.integers(MIN_MARK, MAX_MARK + 1, int(counts.sum()), dtype=np.uint8).tobytes())
+        batch.offsets.frombytes(np.cumsum(counts, dtype=np.uint32).tobytes())
+
+    def _fill_python(self, batch, n):
+        rng = self.rng
+        batch.names.extend(rng.choices(NAMES, k=n))
+        batch.student_ids.extend([rng.randrange(MIN_STUDENT_ID, MAX_STUDENT_ID + 1)
+                                  for _ in range(n)])
+        batch.programme_codes.extend(rng.choices(range(len(ITStudent.PROGRAMMES)), k=n))
+
+        counts = rng.choices(range(MIN_COURSES, MAX_COURSES + 1), k=n)
+        course_codes = range(len(ITStudent.COURSES))
+        total = 0
+        for count in counts:
+            batch.course_codes.extend(rng.sample(course_codes, count))
+            total += count
+            batch.offsets.append(total)
+        batch.marks.extend(rng.choices(range(MIN_MARK, MAX_MARK + 1), k=total))
+
+    def serialize(self, n, codec='xml', first_number=1, out=None):
+        """Draw ``n`` students straight into one pre-serialized payload.
+
+        Returns (items, payload) in the PRODUCE_MANY layout, numbered from
+        ``first_number``. The payload is written to ``out`` (a bytearray,
+        cleared first, so the payload it held is overwritten) or a new
+        bytearray.
+        """
+        if out is not None:
+            out.clear()
+        sizes, payload = serialize_batch(self.generate(n), codec, out)
+        items = [{'file_number': first_number + i, 'size': size}
+                 for i, size in enumerate(sizes)]
+        return items, payload
+
+
+def serialize_batch(batch, codec='xml', out=None):
+    """Append every student of ``batch``, encoded with ``codec``, to ``out``.
+
+    Returns (sizes, out). XML and binary records are written straight from
+    the batch's columns, byte for byte what the codec itself produces;
+    other codecs encode one rebuilt ITStudent at a time.
+    """
+    codec = get_codec(codec) if isinstance(codec, str) else codec
+    if out is None:
+        out = bytearray()
+    if codec.name == 'xml':
+        sizes = _serialize_xml(batch, out)
+    elif (codec.name == 'binary' and codec.programmes == batch.programmes
+          and codec.courses == batch.courses):
+        sizes = _serialize_binary(batch, codec, out)
+    else:
+        sizes = []
+        for student in batch:
+            data = codec.encode(student)
+            out += data
+            sizes.append(len(data))
+    return sizes, out
+
+
+def _serialize_xml(batch, out):
+    # Same document as ITStudent.to_xml(), from pre-escaped fragments
+    names = {}
+    programmes = [f"</student_id><programme>{escape(programme)}</programme><courses>"
+                  for programme in batch.programmes]
+    courses = [f"<course><course_name>{escape(course)}</course_name><mark>"
+               for course in batch.courses]
+    marks = [f"{mark}</mark></course>" for mark in range(256)]
+    course_codes, course_marks, offsets = batch.course_codes, batch.marks, batch.offsets
+
+    sizes = []
+    for i, name in enumerate(batch.names):
+        head = names.get(name)
+        if head is None:
+            head = names[name] = f"<student><name>{escape(name)}</name><student_id>"
+        parts = [head, f"{batch.student_ids[i]:08d}", programmes[batch.programme_codes[i]]]
+        for j in range(offsets[i], offsets[i + 1]):
+            parts += (courses[course_codes[j]], marks[course_marks[j]])
+        parts.append("</courses></student>")
+        record = "".join(parts).encode('utf-8')
+        out += record
+        sizes.append(len(record))
+    return sizes
+
+
+def _serialize_binary(batch, codec, out):
+    # Same record as BinaryCodec.encode() for numeric 8-digit IDs
+    header_id = struct.Struct('!BBBI')
+    names = {}
+    course_codes, course_marks, offsets = batch.course_codes, batch.marks, batch.offsets
+
+    sizes = []
+    for i, name in enumerate(batch.names):
+        if name not in names:
+            encoded = name.encode('utf-8')
+            # Too long a name is left to the codec (which rejects it)
+            names[name] = (bytes((len(encoded),)) + encoded
+                           if len(encoded) <= 0xFF else None)
+        packed_name = names[name]
+        student_id = batch.student_ids[i]
+        start, end = offsets[i], offsets[i + 1]
+        if student_id > MAX_STUDENT_ID or packed_name is None or end - start > 0xFF:
+            record = codec.encode(batch[i])
+        else:
+            courses = bytearray(2 * (end - start))
+            courses[0::2] = course_codes[start:end]
+            courses[1::2] = course_marks[start:end]
+            record = (header_id.pack(BinaryCodec.NUMERIC_ID, batch.programme_codes[i],
+                                     end - start, student_id)
+                      + packed_name + courses)
+        out += record
+        sizes.append(len(record))
+    return sizes
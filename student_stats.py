@@ -0,0 +1,113 @@
+import math
+import threading
+from array import array
+
+PASS_MARK = 50
+MAX_MARK = 100
+
+
+class MarkStats:
+    """Running statistics of marks, updated in O(1) per value.
+
+    Count, mean and variance use Welford's algorithm; percentiles come from
+    a histogram with one bin per whole mark (0-100), so they are exact for
+    integer marks and within one mark for averages.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max", "passed", "bins")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.passed = 0
+        self.bins = array('I', bytes(4 * (MAX_MARK + 1)))
+
+    def add(self, value):
+        """Record one mark (or average mark)."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value >= PASS_MARK:
+            self.passed += 1
+        self.bins[min(max(int(value), 0), MAX_MARK)] += 1
+
+    @property
+    def variance(self):
+        """Population variance of the values."""
+        return self.m2 / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Nearest-rank percentile, to the whole mark."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for mark, n in enumerate(self.bins):
+            seen += n
+            if seen >= rank:
+                return mark
+        return MAX_MARK
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'variance': self.variance,
+            'stddev': math.sqrt(self.variance),
+            'min': self.min,
+            'max': self.max,
+            'pass_rate': self.passed / self.count if self.count else None,
+            'p25': self.percentile(0.25),
+            'p50': self.percentile(0.50),
+            'p75': self.percentile(0.75),
+            'p90': self.percentile(0.90)
+        }
+
+
+class StudentStats:
+    """Streaming aggregates over consumed students.
+
+    Keeps the distribution of student averages (and so the pass rate) per
+    programme and overall, and the distribution of marks per course. Safe to
+    feed from several consumer threads and to query while they run.
+    """
+
+    def __init__(self):
+        self.overall = MarkStats()
+        self.programmes = {}
+        self.courses = {}
+        self.lock = threading.Lock()
+
+    def add(self, student):
+        """Fold one student into the aggregates."""
+        average = student.calculate_average()
+        with self.lock:
+            self.overall.add(average)
+            stats = self.programmes.get(student.programme)
+            if stats is None:
+                stats = self.programmes[student.programme] = MarkStats()
+            stats.add(average)
+            for course_name, mark in student.courses.items():
+                stats = self.courses.get(course_name)
+                if stats is None:
+                    stats = self.courses[course_name] = MarkStats()
+                stats.add(mark)
+
+    def snapshot(self):
+        """The aggregates as plain dicts (averages per programme, marks per course)."""
+        with self.lock:
+            return {
+                'students': self.overall.snapshot(),
+                'programmes': {name: stats.snapshot()
+                               for name, stats in sorted(self.programmes.items())},
+                'courses': {name: stats.snapshot()
+                            for name, stats in sorted(self.courses.items())}
+            }